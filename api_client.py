@@ -0,0 +1,110 @@
+import asyncio
+import logging
+from typing import Optional
+
+import aiohttp
+from aiogram.utils import json
+from aiogram.utils.exceptions import NetworkError, RestartingTelegram
+
+from metrics import InstrumentedBot
+
+log = logging.getLogger(__name__)
+
+# Calls that change nothing, or change it to the same end state however often they repeat.
+IDEMPOTENT_METHODS = frozenset(
+    {
+        "getMe",
+        "getUpdates",
+        "getChat",
+        "getChatMember",
+        "getFile",
+        "getWebhookInfo",
+        "setWebhook",
+        "deleteWebhook",
+        "setMyCommands",
+        "editMessageText",
+        "editMessageCaption",
+        "editMessageReplyMarkup",
+    }
+)
+
+# Uploads need longer than the default; getUpdates is sized from its own long-poll timeout.
+METHOD_TIMEOUTS = {"sendPhoto": 60.0, "sendDocument": 60.0, "sendMediaGroup": 90.0}
+
+
+class PooledBot(InstrumentedBot):
+    """
+    Bot with a bounded, tuned connection pool and a cap on in-flight API calls.
+
+    aiogram's default session has no connection limit and a five-minute timeout, so a spike
+    opens a socket per call and a stuck request holds its handler for minutes. Here at most
+    ``max_in_flight`` calls run at once over at most ``pool_size`` kept-alive connections,
+    every call has a per-method timeout, and calls that are safe to repeat are retried on
+    network errors, timeouts and Telegram restarts. Any call is retried if the connection
+    could not be opened at all, since nothing reached Telegram.
+    """
+
+    def __init__(
+        self,
+        token: str,
+        pool_size: int = 100,
+        keepalive_timeout: float = 30.0,
+        dns_ttl: int = 300,
+        max_in_flight: int = 64,
+        default_timeout: float = 10.0,
+        method_timeouts: Optional[dict[str, float]] = None,
+        retries: int = 2,
+        retry_delay: float = 0.5,
+        **kwargs,
+    ) -> None:
+        super().__init__(token, connections_limit=pool_size, **kwargs)
+        self.pool_size = pool_size
+        self.keepalive_timeout = keepalive_timeout
+        self.dns_ttl = dns_ttl
+        self.default_timeout = default_timeout
+        self.method_timeouts = {**METHOD_TIMEOUTS, **(method_timeouts or {})}
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self._in_flight = asyncio.Semaphore(max_in_flight)
+
+    async def get_new_session(self) -> aiohttp.ClientSession:
+        # Keep aiogram's connector class and arguments: a socks5:// proxy swaps in its own connector.
+        connector = self._connector_class(
+            **{**self._connector_init, "ttl_dns_cache": self.dns_ttl, "keepalive_timeout": self.keepalive_timeout}
+        )
+        return aiohttp.ClientSession(connector=connector, json_serialize=json.dumps)
+
+    def timeout_for(self, method: str, data: Optional[dict]) -> float:
+        if method == "getUpdates":
+            return float((data or {}).get("timeout") or 0) + self.default_timeout
+        return self.method_timeouts.get(method, self.default_timeout)
+
+    @staticmethod
+    def _not_sent(error: Exception) -> bool:
+        # aiogram wraps aiohttp errors in NetworkError; the original is kept as the context.
+        return isinstance(error, NetworkError) and isinstance(error.__context__, aiohttp.ClientConnectorError)
+
+    async def request(self, method, data=None, files=None, **kwargs):
+        attempt = 0
+        while True:
+            try:
+                # An explicit request_timeout() from the caller wins over the per-method default.
+                if self._ctx_timeout.get(None) is None:
+                    with self.request_timeout(self.timeout_for(method, data)):
+                        return await self._limited(method, data, files, **kwargs)
+                return await self._limited(method, data, files, **kwargs)
+            except (NetworkError, RestartingTelegram, asyncio.TimeoutError) as error:
+                retryable = method in IDEMPOTENT_METHODS or self._not_sent(error)
+                if not retryable or attempt >= self.retries:
+                    raise
+                delay = self.retry_delay * 2**attempt
+                attempt += 1
+                log.warning("%s failed (%r), retry %d/%d in %.1f s", method, error, attempt, self.retries, delay)
+                await asyncio.sleep(delay)
+
+    async def _limited(self, method, data, files, **kwargs):
+        if method == "getUpdates":
+            # A long poll would hold a slot for its whole timeout.
+            return await super().request(method, data, files, **kwargs)
+        async with self._in_flight:
+            return await super().request(method, data, files, **kwargs)
@@ -0,0 +1,81 @@
+"""Bot API call latency under a burst: aiogram's default session against PooledBot.
+
+    python -m benchmarks.api_client --calls 2000 --delay 0.02 --stall-every 200
+
+The fake Bot API runs over real HTTP on localhost. Every ``--stall-every``-th call hangs for
+``--stall-time`` seconds, like a request Telegram never answers.
+"""
+import argparse
+import asyncio
+import logging
+import statistics
+import time
+
+from aiogram import Bot
+from aiogram.bot.api import TelegramAPIServer
+
+from api_client import PooledBot
+from benchmarks.fake_telegram import FAKE_TOKEN, FakeTelegram
+
+
+async def burst(bot: Bot, calls: int) -> tuple[list[float], int]:
+    latencies: list[float] = []
+    failures = 0
+
+    async def call(number: int) -> None:
+        nonlocal failures
+        started = time.perf_counter()
+        try:
+            # One call in five is a read that PooledBot may retry.
+            if number % 5:
+                await bot.send_message(1000 + number, "📞 Контакты")
+            else:
+                await bot.get_me()
+        except Exception:
+            failures += 1
+        latencies.append(time.perf_counter() - started)
+
+    await asyncio.gather(*(call(number) for number in range(calls)))
+    await (await bot.get_session()).close()
+    return latencies, failures
+
+
+def report(name: str, latencies: list[float], failures: int, elapsed: float, sockets: int) -> None:
+    latencies.sort()
+    p50 = statistics.median(latencies) * 1000
+    p99 = latencies[int(len(latencies) * 0.99)] * 1000
+    print(
+        f"{name:8s} p50={p50:8.1f}ms p99={p99:8.1f}ms max={latencies[-1] * 1000:8.1f}ms "
+        f"failed={failures} elapsed={elapsed:.2f}s sockets={sockets}"
+    )
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=2000)
+    parser.add_argument("--delay", type=float, default=0.02)
+    parser.add_argument("--stall-every", type=int, default=200)
+    parser.add_argument("--stall-time", type=float, default=30.0)
+    parser.add_argument("--timeout", type=float, default=2.0, help="PooledBot default per-call timeout")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.ERROR)
+
+    fake = FakeTelegram(reply_delay=args.delay)
+    server = TelegramAPIServer.from_base(await fake.start())
+    fake.stall_every = args.stall_every
+    fake.stall_time = args.stall_time
+
+    bots = {
+        "default": Bot(FAKE_TOKEN, server=server),
+        "pooled": PooledBot(FAKE_TOKEN, server=server, default_timeout=args.timeout, retry_delay=0.1),
+    }
+    for name, bot in bots.items():
+        fake.connections.clear()
+        started = time.perf_counter()
+        latencies, failures = await burst(bot, args.calls)
+        report(name, latencies, failures, time.perf_counter() - started, len(fake.connections))
+    await fake.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,64 @@
+"""Broadcast throughput against the local fake Bot API, including flood waits and blocked users.
+
+    python -m benchmarks.broadcast --chats 1000 --rate 25 --blocked 0.05 --interrupt 300
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import tempfile
+
+from aiogram import Bot
+
+from benchmarks.fake_telegram import FAKE_TOKEN, FakeTelegram
+from broadcast import Broadcaster, ChatRegistry
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chats", type=int, default=1000)
+    parser.add_argument("--rate", type=float, default=25)
+    parser.add_argument("--delay", type=float, default=0.05)
+    parser.add_argument("--blocked", type=float, default=0.05, help="share of chats that blocked the bot")
+    parser.add_argument("--flood-waits", type=int, default=1, help="429 answers to inject")
+    parser.add_argument("--interrupt", type=int, default=0, help="cancel after this many sends, then resume")
+    parser.add_argument("--chunk", type=int, default=100)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    fake = FakeTelegram(reply_delay=args.delay)
+    rng = random.Random(1)
+    chat_ids = rng.sample(range(10_000, 10_000_000), args.chats)
+    fake.blocked_chats = set(rng.sample(chat_ids, int(args.chats * args.blocked)))
+    fake.fail_methods["sendMessage"] = args.flood_waits
+
+    bot = Bot(FAKE_TOKEN)
+    bot._session = fake.session()
+    with tempfile.TemporaryDirectory() as directory:
+        registry = ChatRegistry(os.path.join(directory, "chats.sqlite3"))
+        for chat_id in chat_ids:
+            registry.add(chat_id)
+        broadcaster = Broadcaster(registry, rate=args.rate, chunk_size=args.chunk)
+        broadcast_id = registry.create_broadcast("Новые проекты в каталоге!")
+
+        if args.interrupt:
+            run = asyncio.create_task(broadcaster.run(bot, broadcast_id))
+            await fake.wait_for_calls(args.interrupt, "sendMessage")
+            run.cancel()
+            await asyncio.gather(run, return_exceptions=True)
+            print(f"interrupted after {len(fake.calls_to('sendMessage'))} sends")
+
+        report = (await broadcaster.resume(bot))[0]
+        sends = fake.calls_to("sendMessage")
+        print(
+            f"chats={args.chats} target={args.rate:.0f}/s achieved={report.rate:.1f}/s elapsed={report.elapsed:.1f}s "
+            f"sent={report.sent} pruned={report.pruned} failed={report.failed} "
+            f"api_calls={len(sends)} duplicates={len(sends) - len({params['chat_id'] for params in sends})} "
+            f"left_in_registry={registry.count()}"
+        )
+        registry.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,274 @@
+import asyncio
+import itertools
+import json
+import time
+from typing import Optional
+
+import aiohttp
+from aiohttp import web
+
+FAKE_TOKEN = "123456:FAKE-token-for-local-benchmarks"
+
+
+def message_update(update_id: int, chat_id: int, text: str) -> dict:
+    message = {
+        "message_id": update_id,
+        "date": int(time.time()),
+        "chat": {"id": chat_id, "type": "private", "first_name": "User"},
+        "from": {"id": chat_id, "is_bot": False, "first_name": "User"},
+        "text": text,
+    }
+    if text.startswith("/"):
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+    return {"update_id": update_id, "message": message}
+
+
+def contact_update(update_id: int, chat_id: int, phone: str) -> dict:
+    update = message_update(update_id, chat_id, "")
+    del update["message"]["text"]
+    update["message"]["contact"] = {"phone_number": phone, "first_name": "User", "user_id": chat_id}
+    return update
+
+
+def callback_update(update_id: int, chat_id: int, data: str) -> dict:
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id),
+            "from": {"id": chat_id, "is_bot": False, "first_name": "User"},
+            "chat_instance": str(chat_id),
+            "data": data,
+            "message": {
+                "message_id": update_id,
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private", "first_name": "User"},
+                "text": "",
+            },
+        },
+    }
+
+
+class FakeTelegram:
+    """A local stand-in for the Bot API: records calls and delivers updates by polling or webhook."""
+
+    def __init__(self, token: str = FAKE_TOKEN, reply_delay: float = 0.0) -> None:
+        self.token = token
+        self.reply_delay = reply_delay
+        self.calls: list[tuple[str, dict]] = []
+        self.webhook_url: Optional[str] = None
+        self.webhook_secret: Optional[str] = None
+        self.webhook_connections = 40
+        self.fail_methods: dict[str, int] = {}
+        self.blocked_chats: set[int] = set()
+        self.stall_every = 0
+        self.stall_time = 30.0
+        self.connections: set[tuple] = set()
+        self._call_numbers = itertools.count(1)
+        self.inline_replies = 0
+        self._pending: list[dict] = []
+        self._new_updates = asyncio.Event()
+        self._message_ids = itertools.count(1)
+        self._file_ids = itertools.count(1)
+        self._runner: Optional[web.AppRunner] = None
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._delivery: Optional[asyncio.Semaphore] = None
+        self._called = asyncio.Condition()
+        self.url = ""
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        app = web.Application()
+        app.router.add_route("*", "/bot{token}/{method}", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://{host}:{port}"
+        self._session = aiohttp.ClientSession()
+        return self.url
+
+    async def stop(self) -> None:
+        if self._session:
+            await self._session.close()
+        if self._runner:
+            await self._runner.cleanup()
+
+    def calls_to(self, *methods: str) -> list[dict]:
+        return [params for method, params in self.calls if method in methods]
+
+    async def wait_for_calls(self, count: int, *methods: str, timeout: float = 60) -> None:
+        async def _wait() -> None:
+            async with self._called:
+                await self._called.wait_for(lambda: len(self.calls_to(*methods)) >= count)
+
+        await asyncio.wait_for(_wait(), timeout)
+
+    async def push(self, update: dict) -> None:
+        if self.webhook_url is None:
+            self._pending.append(update)
+            self._new_updates.set()
+            return
+        if self._delivery is None:
+            self._delivery = asyncio.Semaphore(self.webhook_connections)
+        headers = {"X-Telegram-Bot-Api-Secret-Token": self.webhook_secret} if self.webhook_secret else {}
+        async with self._delivery:
+            async with self._session.post(self.webhook_url, json=update, headers=headers) as response:
+                body = await response.text()
+                if response.status != 200:
+                    raise RuntimeError(f"Webhook answered {response.status}: {body}")
+        if body.startswith("{"):
+            payload = json.loads(body)
+            self.inline_replies += 1
+            await self._record(payload.pop("method"), payload)
+
+    async def _record(self, method: str, params: dict) -> None:
+        async with self._called:
+            self.calls.append((method, params))
+            self._called.notify_all()
+
+    async def _read_params(self, request: web.Request) -> dict:
+        if request.content_type == "application/json":
+            return await request.json()
+        form = await request.post()
+        params = {}
+        for key, value in form.items():
+            if isinstance(value, web.FileField):
+                params[key] = value.file.read()
+            else:
+                params[key] = value
+        return params
+
+    async def call(self, method: str, params: dict) -> tuple[int, dict]:
+        if method != "getUpdates":
+            await self._record(method, params)
+        if self.reply_delay:
+            await asyncio.sleep(self.reply_delay)
+        if self.stall_every and next(self._call_numbers) % self.stall_every == 0:
+            # A request Telegram accepted but never answers in time.
+            await asyncio.sleep(self.stall_time)
+        if self.fail_methods.get(method):
+            self.fail_methods[method] -= 1
+            return 429, {
+                "ok": False,
+                "error_code": 429,
+                "description": "Too Many Requests: retry after 1",
+                "parameters": {"retry_after": 1},
+            }
+        if method == "getUpdates" and self.webhook_url:
+            return 409, {"ok": False, "error_code": 409, "description": "Conflict: can't use getUpdates method while webhook is active"}
+        if params.get("chat_id") and int(params["chat_id"]) in self.blocked_chats:
+            return 403, {"ok": False, "error_code": 403, "description": "Forbidden: bot was blocked by the user"}
+        return 200, {"ok": True, "result": await self._result(method, params)}
+
+    def session(self) -> "FakeSession":
+        return FakeSession(self)
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        if request.match_info["token"] != self.token:
+            return web.json_response({"ok": False, "error_code": 401, "description": "Unauthorized"}, status=401)
+        self.connections.add(request.transport.get_extra_info("peername"))
+        params = await self._read_params(request)
+        status, payload = await self.call(request.match_info["method"], params)
+        return web.json_response(payload, status=status)
+
+    def _message(self, params: dict, **extra) -> dict:
+        chat_id = int(params.get("chat_id", 0))
+        return {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            **extra,
+        }
+
+    async def _result(self, method: str, params: dict):
+        if method == "getMe":
+            return {"id": 1, "is_bot": True, "first_name": "Fake", "username": "fake_bot"}
+        if method == "getUpdates":
+            return await self._get_updates(params)
+        if method == "getWebhookInfo":
+            return {"url": self.webhook_url or "", "has_custom_certificate": False, "pending_update_count": len(self._pending)}
+        if method == "setWebhook":
+            self.webhook_url = params.get("url") or None
+            self.webhook_secret = params.get("secret_token")
+            if params.get("max_connections"):
+                self.webhook_connections = int(params["max_connections"])
+            return True
+        if method == "deleteWebhook":
+            self.webhook_url = None
+            return True
+        if method == "sendMessage":
+            return self._message(params, text=params.get("text", ""))
+        if method == "sendPhoto":
+            photo = params.get("photo")
+            file_id = photo if isinstance(photo, str) and not photo.startswith("http") else f"fake-file-{next(self._file_ids)}"
+            size = {"file_id": file_id, "file_unique_id": file_id, "width": 1280, "height": 960}
+            return self._message(params, photo=[size], caption=params.get("caption", ""))
+        if method == "sendDocument":
+            document = {"file_id": f"fake-file-{next(self._file_ids)}", "file_unique_id": "document"}
+            return self._message(params, document=document, caption=params.get("caption", ""))
+        return True
+
+    async def _get_updates(self, params: dict) -> list[dict]:
+        offset = int(params.get("offset") or 0)
+        self._pending = [update for update in self._pending if update["update_id"] >= offset]
+        if not self._pending:
+            self._new_updates.clear()
+            try:
+                await asyncio.wait_for(self._new_updates.wait(), float(params.get("timeout") or 0) or 0.01)
+            except asyncio.TimeoutError:
+                return []
+        limit = int(params.get("limit") or 100)
+        return self._pending[:limit]
+
+
+class _FakeResponse:
+    content_type = "application/json"
+
+    def __init__(self, status: int, payload: dict) -> None:
+        self.status = status
+        self._body = json.dumps(payload)
+
+    async def text(self) -> str:
+        return self._body
+
+    async def __aenter__(self) -> "_FakeResponse":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        pass
+
+
+class FakeSession:
+    """
+    Drop-in for the aiohttp session a Bot uses, answering from FakeTelegram without sockets.
+
+        bot._session = fake.session()
+    """
+
+    closed = False
+
+    def __init__(self, fake: FakeTelegram) -> None:
+        self.fake = fake
+        self._loop = asyncio.get_running_loop()
+
+    def post(self, url: str, data=None, **kwargs) -> "_FakeCall":
+        return _FakeCall(self.fake, url.rsplit("/", 1)[1], data)
+
+    async def close(self) -> None:
+        pass
+
+
+class _FakeCall:
+    def __init__(self, fake: FakeTelegram, method: str, data) -> None:
+        self.fake = fake
+        self.method = method
+        self.params = {}
+        # aiogram hands over an aiohttp.FormData; read the fields back out of it.
+        for options, _headers, value in getattr(data, "_fields", []):
+            self.params[options["name"]] = value if isinstance(value, str) else getattr(value, "name", value)
+
+    async def __aenter__(self) -> _FakeResponse:
+        return _FakeResponse(*await self.fake.call(self.method, self.params))
+
+    async def __aexit__(self, *exc_info) -> None:
+        pass
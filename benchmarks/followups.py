@@ -0,0 +1,77 @@
+"""Cost of tracking idle sessions: TimingWheel against one loop.call_later handle per session.
+
+    python -m benchmarks.followups --sessions 300000 --touches 3
+"""
+import argparse
+import asyncio
+import random
+import time
+import tracemalloc
+
+from followups import TimingWheel
+
+
+def touch_all(sessions: int, touches: int, schedule) -> float:
+    rng = random.Random(1)
+    started = time.perf_counter()
+    for _ in range(touches):
+        for session in range(sessions):
+            schedule((session, session), 3600 + rng.random() * 60)
+    return time.perf_counter() - started
+
+
+def measure(label: str, sessions: int, touches: int, make_schedule) -> None:
+    # Time and memory come from separate runs: tracing allocations slows everything down.
+    elapsed = touch_all(sessions, touches, make_schedule())
+    tracemalloc.start()
+    touch_all(sessions, touches, make_schedule())
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    per_touch = elapsed / (sessions * touches) * 1e6
+    print(f"{label:11s} {per_touch:6.2f}us/touch  {memory / sessions:6.0f} B/session  {memory / 2**20:7.1f} MB")
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=300_000)
+    parser.add_argument("--touches", type=int, default=3)
+    args = parser.parse_args()
+
+    now = time.time()
+    wheels = []
+
+    def wheel_schedule():
+        wheel = TimingWheel(now=now)
+        wheels.append(wheel)
+        return lambda key, delay: wheel.schedule(key, now + delay)
+
+    measure("TimingWheel", args.sessions, args.touches, wheel_schedule)
+    wheel = wheels[0]
+
+    loop = asyncio.get_running_loop()
+    tables = []
+
+    def call_later_schedule():
+        handles = {}
+        tables.append(handles)
+
+        def schedule(key, delay) -> None:
+            handle = handles.pop(key, None)
+            if handle is not None:
+                handle.cancel()
+            handles[key] = loop.call_later(delay, print, key)
+
+        return schedule
+
+    measure("call_later", args.sessions, args.touches, call_later_schedule)
+    for handles in tables:
+        for handle in handles.values():
+            handle.cancel()
+
+    started = time.perf_counter()
+    expired = wheel.advance(now + 3700)
+    print(f"advance one hour: {len(expired)} expired in {time.perf_counter() - started:.2f}s")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
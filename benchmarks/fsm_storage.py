@@ -0,0 +1,61 @@
+"""Measure get_data/update_data latency of MemoryStorage against SQLiteStorage.
+
+    python -m benchmarks.fsm_storage --users 5000 --rounds 6
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+from aiogram.contrib.fsm_storage.memory import MemoryStorage
+
+from fsm_storage import SQLiteStorage
+
+
+async def measure(storage, users: int, rounds: int) -> dict[str, list[float]]:
+    timings: dict[str, list[float]] = {"update_data": [], "get_data": []}
+    for step in range(rounds):
+        for user in range(users):
+            started = time.perf_counter()
+            await storage.update_data(chat=user, user=user, data={f"step{step}": "Газобетон / Монолит"})
+            timings["update_data"].append(time.perf_counter() - started)
+            started = time.perf_counter()
+            await storage.get_data(chat=user, user=user)
+            timings["get_data"].append(time.perf_counter() - started)
+    return timings
+
+
+def report(name: str, timings: dict[str, list[float]]) -> None:
+    for operation, samples in timings.items():
+        samples.sort()
+        p50 = statistics.median(samples) * 1e6
+        p99 = samples[int(len(samples) * 0.99)] * 1e6
+        print(f"{name:14s} {operation:12s} p50={p50:7.1f}us p99={p99:7.1f}us")
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--rounds", type=int, default=6)
+    args = parser.parse_args()
+
+    memory = MemoryStorage()
+    report("MemoryStorage", await measure(memory, args.users, args.rounds))
+
+    with tempfile.TemporaryDirectory() as directory:
+        sqlite = SQLiteStorage(os.path.join(directory, "fsm.sqlite3"))
+        report("SQLiteStorage", await measure(sqlite, args.users, args.rounds))
+        await sqlite.close()
+        await sqlite.wait_closed()
+
+        # Cold cache: every first read goes to disk.
+        sqlite = SQLiteStorage(os.path.join(directory, "fsm.sqlite3"))
+        report("SQLite (cold)", await measure(sqlite, args.users, 1))
+        await sqlite.close()
+        await sqlite.wait_closed()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
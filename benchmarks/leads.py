@@ -0,0 +1,96 @@
+"""Lead intake latency with write-behind batching, and paginated export speed.
+
+    python -m benchmarks.leads --leads 50000 --repeat 0.3
+
+"write-through" is the naive alternative: one INSERT and commit per lead on the event loop.
+"""
+import argparse
+import asyncio
+import io
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+
+from leads import LeadStore, normalize_phone
+
+
+def phones(count: int, repeat: float, seed: int = 1) -> list[str]:
+    rng = random.Random(seed)
+    formats = ["8 ({}) {}-{}-{}", "+7 {} {} {} {}", "7{}{}{}{}"]
+    submitted: list[str] = []
+    for _ in range(count):
+        if submitted and rng.random() < repeat:
+            submitted.append(rng.choice(submitted))
+            continue
+        number = f"{rng.randint(900, 999)}{rng.randint(0, 9999999):07d}"
+        submitted.append(rng.choice(formats).format(number[:3], number[3:6], number[6:8], number[8:]))
+    return submitted
+
+
+def report(label: str, samples: list[float], elapsed: float) -> None:
+    samples.sort()
+    print(
+        f"{label:13s} add p50={statistics.median(samples) * 1e6:6.1f}us p99={samples[int(len(samples) * 0.99)] * 1e6:7.1f}us "
+        f"total={elapsed:.2f}s"
+    )
+
+
+async def write_behind(path: str, submitted: list[str]) -> LeadStore:
+    store = LeadStore(path)
+    samples = []
+    started = time.perf_counter()
+    for number, phone in enumerate(submitted):
+        began = time.perf_counter()
+        store.add("CostQuiz", number, "User", phone, {"floors": "2 этажа", "material": "Кирпич"})
+        samples.append(time.perf_counter() - began)
+        if number % 100 == 0:
+            await asyncio.sleep(0)  # let the flusher run as it would between updates
+    await store.flush()
+    report("write-behind", samples, time.perf_counter() - started)
+    return store
+
+
+def write_through(path: str, submitted: list[str]) -> None:
+    db = sqlite3.connect(path, isolation_level=None)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+    db.execute("CREATE TABLE leads (id INTEGER PRIMARY KEY, chat_id INTEGER, phone TEXT, raw_phone TEXT, duplicate INTEGER)")
+    db.execute("CREATE INDEX leads_phone ON leads (phone)")
+    samples = []
+    started = time.perf_counter()
+    for number, phone in enumerate(submitted):
+        began = time.perf_counter()
+        normalized = normalize_phone(phone)
+        duplicate = db.execute("SELECT 1 FROM leads WHERE phone = ? LIMIT 1", (normalized,)).fetchone() is not None
+        db.execute("INSERT INTO leads (chat_id, phone, raw_phone, duplicate) VALUES (?, ?, ?, ?)", (number, normalized, phone, duplicate))
+        samples.append(time.perf_counter() - began)
+    report("write-through", samples, time.perf_counter() - started)
+    db.close()
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--leads", type=int, default=50_000)
+    parser.add_argument("--repeat", type=float, default=0.3, help="share of submissions repeating an earlier phone")
+    args = parser.parse_args()
+    submitted = phones(args.leads, args.repeat)
+
+    with tempfile.TemporaryDirectory() as directory:
+        write_through(os.path.join(directory, "through.sqlite3"), submitted)
+        store = await write_behind(os.path.join(directory, "leads.sqlite3"), submitted)
+        duplicates = len(store.page(0, args.leads)) - len({normalize_phone(phone) for phone in submitted})
+        print(f"duplicates flagged: {sum(row['duplicate'] for row in store.page(0, args.leads))} (expected {duplicates})")
+        for fmt in ("csv", "json"):
+            out = io.StringIO()
+            started = time.perf_counter()
+            count = await store.export(out, fmt, page_size=1000)
+            elapsed = time.perf_counter() - started
+            print(f"export {fmt:4s} {count} leads in {elapsed:.2f}s ({count / elapsed:,.0f}/s, {len(out.getvalue()) / 2**20:.1f} MB)")
+        await store.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,190 @@
+"""Offline load test and replay harness for the dispatcher.
+
+Synthetic mode simulates ``--users`` concurrent chats walking through /lead, CostQuiz,
+DesignQuiz, menu clicks and junk text that lands in ``fallback``:
+
+    python -m benchmarks.loadtest --users 2000 --delay 0.005
+
+Replay mode feeds a JSONL log to the dispatcher. Lines holding a Telegram update
+(``update_id``) are replayed as-is; any other record (e.g. requests.jsonl) becomes one text
+message per string field, sent from a chat derived from the record's first value:
+
+    python -m benchmarks.loadtest --replay requests.jsonl
+
+Bot API calls go to an in-process FakeTelegram that answers after ``--delay`` seconds.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import resource
+import tempfile
+import time
+import zlib
+from collections import defaultdict
+from typing import Iterator
+
+from aiogram import Bot, Dispatcher, types
+
+from benchmarks.fake_telegram import FAKE_TOKEN, FakeTelegram, callback_update, contact_update, message_update
+
+MENU = ["📋 О компании", "📁 Каталог проектов", "🌐 Сайты компании", "📞 Контакты"]
+JUNK = ["привет", "сколько стоит?", "asdf", "👍", "а можно позвонить?"]
+COST_ANSWERS = ["1 этаж", "Кирпич", "до 100 м²", "Выберу из каталога", "В ближайшее время"]
+DESIGN_ANSWERS = ["Кирпич", "2 этажа", "до 250 м²", "Нет", "Через 1–3 месяца"]
+
+
+def user_script(rng: random.Random) -> list[tuple[str, str]]:
+    """One visitor's session as (kind, payload) steps."""
+    scenario = rng.choices(["lead", "cost", "design", "browse", "junk"], weights=[1, 3, 2, 3, 1])[0]
+    steps = [("text", "/start")]
+    if scenario == "lead":
+        steps += [("text", "/lead"), ("text", "Иван"), ("contact", "+79991234567")]
+    elif scenario == "cost":
+        steps += [("text", "🏗 Расчёт стоимости дома"), ("callback", "cost_quiz_start")]
+        steps += [("text", answer) for answer in COST_ANSWERS] + [("contact", "+79991234567")]
+    elif scenario == "design":
+        steps += [("text", "✏️ Архитектурное проектирование"), ("callback", "design_quiz_start")]
+        steps += [("text", answer) for answer in DESIGN_ANSWERS] + [("text", "8 999 123-45-67")]
+    elif scenario == "browse":
+        steps += [("text", rng.choice(MENU)) for _ in range(rng.randint(2, 5))]
+    else:
+        steps += [("text", rng.choice(JUNK)) for _ in range(rng.randint(1, 4))]
+    return steps
+
+
+class UpdateIds:
+    def __init__(self) -> None:
+        self.value = 0
+
+    def __next__(self) -> int:
+        self.value += 1
+        return self.value
+
+
+def build_update(update_ids: UpdateIds, chat_id: int, kind: str, payload: str) -> dict:
+    if kind == "callback":
+        return callback_update(next(update_ids), chat_id, payload)
+    if kind == "contact":
+        return contact_update(next(update_ids), chat_id, payload)
+    return message_update(next(update_ids), chat_id, payload)
+
+
+def synthetic_streams(users: int, seed: int) -> dict[int, list[dict]]:
+    rng = random.Random(seed)
+    update_ids = UpdateIds()
+    return {
+        chat_id: [build_update(update_ids, chat_id, kind, payload) for kind, payload in user_script(rng)]
+        for chat_id in range(10_000, 10_000 + users)
+    }
+
+
+def read_log(path: str) -> Iterator[dict]:
+    update_ids = UpdateIds()
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if "update_id" in record:
+                yield record
+                continue
+            values = [value for value in record.values() if isinstance(value, str)]
+            if not values:
+                continue
+            chat_id = 20_000 + zlib.crc32(values[0].encode()) % 1_000_000
+            for text in values:
+                yield message_update(next(update_ids), chat_id, text[:4096])
+
+
+def replay_streams(path: str) -> dict[int, list[dict]]:
+    streams: dict[int, list[dict]] = defaultdict(list)
+    for update in read_log(path):
+        update_object = types.Update(**update)
+        chat = (update_object.message or update_object.callback_query.message).chat
+        streams[chat.id].append(update)
+    return streams
+
+
+class Stats:
+    def __init__(self) -> None:
+        self.latencies: list[float] = []
+        self.errors = 0
+
+    def percentile(self, fraction: float) -> float:
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] * 1000 if ordered else 0.0
+
+
+async def run_chat(dp: Dispatcher, updates: list[dict], stats: Stats, think_time: float) -> None:
+    # Updates of one chat are processed in order, like aiogram does for a single user.
+    for update in updates:
+        started = time.perf_counter()
+        try:
+            # A fresh task per update gives each one its own context, as polling does.
+            await asyncio.create_task(dp.updates_handler.notify(types.Update(**update)))
+        except Exception:
+            stats.errors += 1
+        stats.latencies.append(time.perf_counter() - started)
+        if think_time:
+            await asyncio.sleep(think_time)
+
+
+def max_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--delay", type=float, default=0.005, help="fake Bot API reply delay, seconds")
+    parser.add_argument("--think-time", type=float, default=0.0, help="pause between a user's messages, seconds")
+    parser.add_argument("--storage", default=None, help="FSM_STORAGE_URL for the run (default: SQLite in a temp dir)")
+    parser.add_argument("--replay", help="JSONL log to replay instead of synthetic users")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="loadtest-")
+    os.environ.setdefault("BOT_TOKEN", FAKE_TOKEN)
+    os.environ.setdefault("ADMIN_CHAT_ID", "1")
+    os.environ["FSM_STORAGE_URL"] = args.storage or f"sqlite:///{workdir}/fsm.sqlite3"
+    os.environ["OUTBOX_PATH"] = os.path.join(workdir, "outbox.sqlite3")
+    os.environ["MEDIA_CACHE_PATH"] = os.path.join(workdir, "media_cache.json")
+    os.environ["CHAT_REGISTRY_PATH"] = os.path.join(workdir, "chats.sqlite3")
+    os.environ["FOLLOWUPS_PATH"] = os.path.join(workdir, "followups.sqlite3")
+    os.environ["LEADS_PATH"] = os.path.join(workdir, "leads.sqlite3")
+    import bot
+
+    logging.getLogger().setLevel(logging.WARNING)
+    fake = FakeTelegram(reply_delay=args.delay)
+    bot.bot._session = fake.session()
+    Bot.set_current(bot.bot)
+    Dispatcher.set_current(bot.dp)
+    bot.outbox.start(bot.bot)
+
+    streams = replay_streams(args.replay) if args.replay else synthetic_streams(args.users, args.seed)
+    total = sum(len(updates) for updates in streams.values())
+    stats = Stats()
+    rss_before = max_rss_mb()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(run_chat(bot.dp, updates, stats, args.think_time) for updates in streams.values()))
+    elapsed = time.perf_counter() - started
+
+    await bot.outbox.stop()
+    await bot.storage.close()
+    await bot.storage.wait_closed()
+
+    calls = defaultdict(int)
+    for method, _params in fake.calls:
+        calls[method] += 1
+    print(f"chats={len(streams)} updates={total} errors={stats.errors} elapsed={elapsed:.2f}s")
+    print(f"throughput={total / elapsed:.0f} updates/s p50={stats.percentile(0.5):.1f}ms p99={stats.percentile(0.99):.1f}ms")
+    print(f"max_rss before={rss_before:.1f}MB after={max_rss_mb():.1f}MB")
+    print("api calls: " + ", ".join(f"{method}={count}" for method, count in sorted(calls.items())))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,81 @@
+"""Scaling of the sharded run mode on the synthetic quiz workload.
+
+    python -m benchmarks.sharding --users 2000 --workers 1 2 4 8
+
+The parent runs FakeTelegram over HTTP and feeds updates straight into the shard queues;
+each worker process talks to it through TELEGRAM_API_URL. Worker start-up is not timed.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import tempfile
+import time
+
+from benchmarks.fake_telegram import FAKE_TOKEN, FakeTelegram
+from benchmarks.loadtest import synthetic_streams
+from sharding import ShardedRunner
+
+
+def interleave(streams: dict[int, list[dict]]) -> list[dict]:
+    # Step n of every chat before step n + 1 of any chat, keeping each chat's own order.
+    ordered = []
+    depth = max(len(updates) for updates in streams.values())
+    for step in range(depth):
+        ordered += [updates[step] for updates in streams.values() if step < len(updates)]
+    return ordered
+
+
+async def run(workers: int, updates: list[dict], fake: FakeTelegram) -> float:
+    workdir = tempfile.mkdtemp(prefix=f"shards-{workers}-")
+    os.environ["FSM_STORAGE_URL"] = f"sqlite:///{workdir}/fsm.sqlite3"
+    os.environ["OUTBOX_PATH"] = os.path.join(workdir, "outbox.sqlite3")
+    os.environ["MEDIA_CACHE_PATH"] = os.path.join(workdir, "media_cache.json")
+    os.environ["CHAT_REGISTRY_PATH"] = os.path.join(workdir, "chats.sqlite3")
+    os.environ["FOLLOWUPS_PATH"] = os.path.join(workdir, "followups.sqlite3")
+    os.environ["LEADS_PATH"] = os.path.join(workdir, "leads.sqlite3")
+    runner = ShardedRunner("bot", workers)
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, runner.start)
+
+    async def count_done() -> int:
+        # Workers cannot exit while their done-queue buffer is unread.
+        finished = 0
+        while finished < len(updates):
+            finished += len(await loop.run_in_executor(None, runner.done.get))
+        return finished
+
+    started = time.perf_counter()
+    counter = asyncio.create_task(count_done())
+    for update in updates:
+        await runner.dispatch(update)
+    await counter
+    elapsed = time.perf_counter() - started
+    await runner.stop()
+    return elapsed
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--delay", type=float, default=0.005)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    fake = FakeTelegram(reply_delay=args.delay)
+    os.environ["TELEGRAM_API_URL"] = await fake.start()
+    os.environ["BOT_TOKEN"] = FAKE_TOKEN
+    os.environ.pop("ADMIN_CHAT_ID", None)
+    updates = interleave(synthetic_streams(args.users, seed=1))
+
+    print(f"cpus={os.cpu_count()} updates={len(updates)}")
+    for workers in args.workers:
+        fake.calls.clear()
+        elapsed = await run(workers, updates, fake)
+        print(f"workers={workers}  {len(updates) / elapsed:7.0f} updates/s  {elapsed:6.2f}s  api_calls={len(fake.calls)}")
+    await fake.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
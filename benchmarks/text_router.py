@@ -0,0 +1,63 @@
+"""Micro-benchmark: one lambda filter per button against the TextRouter dict lookup.
+
+    python -m benchmarks.text_router --buttons 6 30 --updates 20000
+"""
+import argparse
+import asyncio
+import time
+
+from aiogram import Bot, Dispatcher, types
+
+from benchmarks.fake_telegram import FAKE_TOKEN, message_update
+from router import TextRouter
+
+
+async def noop(message: types.Message) -> None:
+    pass
+
+
+def linear_dispatcher(bot: Bot, texts: list[str]) -> Dispatcher:
+    dp = Dispatcher(bot)
+    for text in texts:
+        dp.register_message_handler(noop, lambda msg, text=text: msg.text == text)
+    dp.register_message_handler(noop)
+    return dp
+
+
+def routed_dispatcher(bot: Bot, texts: list[str]) -> Dispatcher:
+    dp = Dispatcher(bot)
+    router = TextRouter({text: text for text in texts})
+    for text in texts:
+        router.route(text)(noop)
+    router.register(dp)
+    dp.register_message_handler(noop)
+    return dp
+
+
+async def measure(dp: Dispatcher, updates: list[types.Update]) -> float:
+    started = time.perf_counter()
+    for update in updates:
+        await dp.process_update(update)
+    return (time.perf_counter() - started) / len(updates) * 1e6
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--buttons", type=int, nargs="+", default=[6, 30])
+    parser.add_argument("--updates", type=int, default=20000)
+    args = parser.parse_args()
+
+    bot = Bot(FAKE_TOKEN)
+    for count in args.buttons:
+        texts = [f"button {i}" for i in range(count)]
+        cases = {"last button": texts[-1], "fallback": "привет"}
+        for case, text in cases.items():
+            updates = [types.Update(**message_update(i, 1, text)) for i in range(args.updates)]
+            linear = await measure(linear_dispatcher(bot, texts), updates)
+            routed = await measure(routed_dispatcher(bot, texts), updates)
+            print(f"{count:3d} buttons  {case:12s} linear={linear:6.1f}us  router={routed:6.1f}us")
+    await (await bot.get_session()).close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,96 @@
+"""Compare polling and webhook delivery against the local fake Bot API.
+
+    python -m benchmarks.webhook_vs_polling --updates 2000 --delay 0.02
+"""
+import argparse
+import asyncio
+import logging
+import os
+import time
+
+from aiogram.bot.api import TelegramAPIServer
+from aiogram.dispatcher.webhook import BOT_DISPATCHER_KEY
+from aiohttp import web
+
+from benchmarks.fake_telegram import FAKE_TOKEN, FakeTelegram, message_update
+
+os.environ.setdefault("BOT_TOKEN", FAKE_TOKEN)
+
+import bot  # noqa: E402
+import webhook  # noqa: E402
+
+SECRET = "benchmark-secret"
+TEXTS = ["📞 Контакты", "📋 О компании", "привет", "/start"]
+# Not a multiple of len(TEXTS): a chat never gets the same text twice in a row, which the
+# throttling middleware would drop as a repeat and leave the benchmark waiting for its reply.
+CHATS = 499
+
+
+def make_updates(count: int) -> list[dict]:
+    return [message_update(i + 1, 1000 + i % CHATS, TEXTS[i % len(TEXTS)]) for i in range(count)]
+
+
+async def run_polling(fake: FakeTelegram, updates: list[dict]) -> float:
+    polling = asyncio.create_task(bot.dp.start_polling(timeout=1, relax=0))
+    started = time.perf_counter()
+    for update in updates:
+        await fake.push(update)
+    await fake.wait_for_calls(len(updates), "sendMessage")
+    elapsed = time.perf_counter() - started
+    bot.dp.stop_polling()
+    await polling
+    return elapsed
+
+
+async def run_webhook(fake: FakeTelegram, updates: list[dict], concurrency: int) -> float:
+    app = web.Application()
+    webhook.configure_app(app, SECRET, concurrency)
+    app.router.add_route("*", "/webhook", webhook.SecureWebhookRequestHandler)
+    app[BOT_DISPATCHER_KEY] = bot.dp
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    await bot.bot.set_webhook(f"http://127.0.0.1:{port}/webhook", secret_token=SECRET, max_connections=concurrency)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(fake.push(update) for update in updates))
+    await fake.wait_for_calls(len(updates), "sendMessage")
+    elapsed = time.perf_counter() - started
+
+    await bot.bot.delete_webhook()
+    await runner.cleanup()
+    return elapsed
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--updates", type=int, default=2000)
+    parser.add_argument("--delay", type=float, default=0.02, help="simulated Bot API round trip, seconds")
+    parser.add_argument("--concurrency", type=int, default=40)
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    for mode in ("polling", "webhook"):
+        fake = FakeTelegram(reply_delay=args.delay)
+        await fake.start()
+        bot.bot.server = TelegramAPIServer.from_base(fake.url)
+        updates = make_updates(args.updates)
+        if mode == "polling":
+            elapsed = await run_polling(fake, updates)
+        else:
+            elapsed = await run_webhook(fake, updates, args.concurrency)
+        replies = len(fake.calls_to("sendMessage"))
+        await fake.stop()
+        print(
+            f"{mode:8s} {args.updates / elapsed:8.0f} updates/s  {elapsed:6.2f}s  "
+            f"replies={replies} outgoing_api_calls={replies - fake.inline_replies}"
+        )
+
+    session = await bot.bot.get_session()
+    await session.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,27 +1,113 @@
+import asyncio
+import io
+import json
 import logging
 import os
+import time
 from typing import Optional
 
-from aiogram import Bot, Dispatcher, executor, types
-from aiogram.contrib.fsm_storage.memory import MemoryStorage
+from aiogram import Dispatcher, types
+from aiogram.bot.api import TELEGRAM_PRODUCTION, TelegramAPIServer
 from aiogram.dispatcher import FSMContext
 from aiogram.dispatcher.filters.state import State, StatesGroup
-from aiogram.types import CallbackQuery, ContentType, InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup, ReplyKeyboardRemove
+from aiogram.types import CallbackQuery, ContentType, ReplyKeyboardRemove
+from aiogram.utils.markdown import quote_html
 from dotenv import load_dotenv
 
+from api_client import PooledBot
+from broadcast import BroadcastReport, Broadcaster, ChatRegistry
+from content import Content, ContentError, ContentStore
+from followups import FollowUpMiddleware, FollowUps
+from fsm_storage import SQLiteStorage, make_storage
+from leads import LeadStore
+from media_cache import MediaCache
+from metrics import MetricsMiddleware, count_states, metrics, start_server as start_metrics_server
+from outbox import Outbox
+from polling import run_polling
+from quiz import QuizEngine, message_phone
+from router import TextRouter
+from sharding import run_sharded
+from throttling import ThrottlingMiddleware
+from webhook import reply, start_webhook
+
 load_dotenv()
 
 logging.basicConfig(level=logging.INFO)
 
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 ADMIN_CHAT_ID = os.getenv("ADMIN_CHAT_ID")
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL")
+API_POOL_SIZE = int(os.getenv("API_POOL_SIZE", "100"))
+API_MAX_IN_FLIGHT = int(os.getenv("API_MAX_IN_FLIGHT", "64"))
+API_TIMEOUT = float(os.getenv("API_TIMEOUT", "10"))
+API_RETRIES = int(os.getenv("API_RETRIES", "2"))
+API_DNS_TTL = int(os.getenv("API_DNS_TTL", "300"))
+
+RUN_MODE = os.getenv("RUN_MODE", "polling")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+WEBHOOK_CONCURRENCY = int(os.getenv("WEBHOOK_CONCURRENCY", "40"))
+WEBAPP_HOST = os.getenv("WEBAPP_HOST", "0.0.0.0")
+WEBAPP_PORT = int(os.getenv("PORT", "8080"))
+UPDATES_JOURNAL_PATH = os.getenv("UPDATES_JOURNAL_PATH", "updates.sqlite3")
+DRAIN_TIMEOUT = float(os.getenv("DRAIN_TIMEOUT", "20"))
+SHARD_WORKERS = int(os.getenv("SHARD_WORKERS", "4"))
+SHARD_QUEUE_SIZE = int(os.getenv("SHARD_QUEUE_SIZE", "1000"))
+MEDIA_CACHE_PATH = os.getenv("MEDIA_CACHE_PATH", "media_cache.json")
+FSM_STORAGE_URL = os.getenv("FSM_STORAGE_URL", "sqlite:///fsm.sqlite3")
+FSM_TTL = int(os.getenv("FSM_TTL", "86400"))
+OUTBOX_PATH = os.getenv("OUTBOX_PATH", "outbox.sqlite3")
+CHAT_REGISTRY_PATH = os.getenv("CHAT_REGISTRY_PATH", "chats.sqlite3")
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", "25"))
+FOLLOWUPS_PATH = os.getenv("FOLLOWUPS_PATH", "followups.sqlite3")
+FOLLOWUP_IDLE = float(os.getenv("FOLLOWUP_IDLE", "3600"))
+FOLLOWUP_EXPIRE = float(os.getenv("FOLLOWUP_EXPIRE", "86400"))
+FOLLOWUP_NOTIFY_ADMIN = os.getenv("FOLLOWUP_NOTIFY_ADMIN", "1") == "1"
+THROTTLE_LIMIT = int(os.getenv("THROTTLE_LIMIT", "10"))
+THROTTLE_PERIOD = float(os.getenv("THROTTLE_PERIOD", "10"))
+THROTTLE_PHOTO_LIMIT = int(os.getenv("THROTTLE_PHOTO_LIMIT", "3"))
+THROTTLE_PHOTO_PERIOD = float(os.getenv("THROTTLE_PHOTO_PERIOD", "60"))
+LEADS_PATH = os.getenv("LEADS_PATH", "leads.sqlite3")
+LEAD_DEDUP_WINDOW = float(os.getenv("LEAD_DEDUP_WINDOW", "86400"))
+# In sharded mode the front end serves METRICS_PORT and shard N serves METRICS_PORT + 1 + N.
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+CONTENT_PATH = os.getenv("CONTENT_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "content.json"))
+QUIZZES_PATH = os.getenv("QUIZZES_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "quizzes.json"))
 
 if not BOT_TOKEN:
     raise RuntimeError("BOT_TOKEN is not set")
 
-bot = Bot(token=BOT_TOKEN, parse_mode=types.ParseMode.HTML)
-storage = MemoryStorage()
+bot = PooledBot(
+    token=BOT_TOKEN,
+    pool_size=API_POOL_SIZE,
+    max_in_flight=API_MAX_IN_FLIGHT,
+    default_timeout=API_TIMEOUT,
+    retries=API_RETRIES,
+    dns_ttl=API_DNS_TTL,
+    parse_mode=types.ParseMode.HTML,
+    server=TelegramAPIServer.from_base(TELEGRAM_API_URL) if TELEGRAM_API_URL else TELEGRAM_PRODUCTION,
+)
+storage = make_storage(FSM_STORAGE_URL, FSM_TTL)
 dp = Dispatcher(bot, storage=storage)
+dp.middleware.setup(MetricsMiddleware())
+dp.middleware.setup(
+    ThrottlingMiddleware(
+        # Every press of these sends a photo, the most expensive reply the bot has.
+        limits={
+            "cost_intro": (THROTTLE_PHOTO_LIMIT, THROTTLE_PHOTO_PERIOD),
+            "design_intro": (THROTTLE_PHOTO_LIMIT, THROTTLE_PHOTO_PERIOD),
+        },
+        default=(THROTTLE_LIMIT, THROTTLE_PERIOD),
+    )
+)
+media_cache = MediaCache(MEDIA_CACHE_PATH)
+outbox = Outbox(OUTBOX_PATH)
+leads = LeadStore(LEADS_PATH, dedup_window=LEAD_DEDUP_WINDOW)
+chat_registry = ChatRegistry(CHAT_REGISTRY_PATH)
+broadcaster = Broadcaster(chat_registry, media_cache, rate=BROADCAST_RATE)
+# The event loop keeps only weak references to tasks.
+background_tasks: set[asyncio.Task] = set()
 
 
 class LeadForm(StatesGroup):
@@ -29,371 +115,298 @@ class LeadForm(StatesGroup):
     waiting_for_contact = State()
 
 
-class CostQuiz(StatesGroup):
-    floors = State()
-    material = State()
-    area = State()
-    project = State()
-    timeline = State()
-    phone = State()
-
-
-class DesignQuiz(StatesGroup):
-    material = State()
-    floors = State()
-    area = State()
-    draft = State()
-    timeline = State()
-    phone = State()
-
-
-MAIN_MENU_BUTTONS = [
-    ["📋 О компании", "📁 Каталог проектов"],
-    ["🏗 Расчёт стоимости дома", "✏️ Архитектурное проектирование"],
-    ["🌐 Сайты компании", "📞 Контакты"],
-]
-
-
-ABOUT_TEXT = (
-    "🏗 Строительная компания СК «Вместе» — это команда архитекторов, инженеров и специалистов, "
-    "которые создают надёжные дома, продуманные проекты и комфортные пространства для жизни. Мы "
-    "работаем «под ключ» и берём на себя всё: от идеи и проектирования до строительства, инженерии, "
-    "отделки и благоустройства территории.\n\n"
-    "❤️ Наш принцип прост — делаем так, как сделали бы для себя. Каждый проект — это не просто "
-    "квадратные метры, а продуманная система, которая должна служить десятилетиями. Поэтому мы "
-    "используем современные технологии, качественные материалы и проводим тщательный контроль на "
-    "каждом этапе.\n\n"
-    "🤝 Мы работаем открыто и честно: фиксированная смета, прозрачные процессы, регулярные отчёты, "
-    "фото- и видеоконтроль объектов. Клиенты понимают, за что платят, и получают именно тот результат, "
-    "который ожидают.\n\n"
-    "🏦 Работаем со всеми видами финансирования: ипотека, материнский капитал, военная ипотека и другие "
-    "форматы, требующие использования эскроу-счёта.\n\n"
-    "🏠 Если вы хотите построить дом, заказать архитектурный проект или подобрать готовое решение — "
-    "оставьте ваш номер телефона или напишите нам прямо сейчас. Наш специалист свяжется с вами, уточнит "
-    "детали и предложит лучшие варианты под ваш бюджет."
-)
-
-
-START_MESSAGE = (
-    "👋 Привет! Я бот компании СК «Вместе»\n\n"
-    "Помогу рассчитать стоимость дома, подобрать проект\n"
-    "или заказать архитектурное решение.\n\n"
-    "Выберите действие из меню ниже 👇\n\n"
-    "📝 Или оставьте заявку здесь 👉 /lead"
-)
-
-
-CATALOG_TEXT = (
-    "📂 Каталог проектов:\n"
-    "https://disk.yandex.ru/d/1df7Hd6PHhoH2g"
-)
-
-
-CONTACTS_TEXT = (
-    "📞 Контакты СК «Вместе»\n\n"
-    "📱 Телефоны:\n"
-    "• <a href='tel:+79286211105'>+7 (928) 621-11-05</a>\n"
-    "• <a href='tel:+79198929402'>+7 (919) 892-94-02</a>\n"
-    "• <a href='tel:+79185381455'>+7 (918) 538-14-55</a>\n\n"
-    "📍 Адрес офиса:\n"
-    "Ростов-на-Дону,\n"
-    "Береговая 8 (Риверсайд), офис 512"
-)
-
-
-COST_INTRO_PHOTO = "https://avatars.mds.yandex.net/get-altay/1879888/2a000001865205a565b7f2ceeb5211295fb7/XXL_height"
-COST_INTRO_TEXT = (
-    "Дома из кирпича, газобетона и монолита в Ростове-на-Дону с гарантией 5 лет напрямую от производителя “под ключ”\n\n"
-    "Любая цветовая гамма и планировка!\n"
-    "Семейная ипотека с применением эскроу-счёта 6%\n\n"
-    "☑️ Штатные архитекторы и дизайнеры, без подрядчиков\n"
-    "☑️ Фиксированная цена и сроки с поэтапной оплатой\n"
-    "☑️ Сделаем бесплатный архитектурный проект — увидите свой дом ещё до постройки\n"
-    "☑️ При необходимости снесем 1 объект и расчистим участок бесплатно\n\n"
-    "Чтобы рассчитать ориентировочную стоимость дома, ответьте на несколько уточняющих вопросов. Это займёт меньше минуты ⏱"
+content = ContentStore(
+    CONTENT_PATH,
+    texts=[
+        "start", "about", "catalog", "contacts", "sites", "fallback", "lead_name", "lead_phone", "done", "reminder",
+        "cost_intro", "design_intro",
+    ],
+    photos=["cost_intro", "design_intro"],
+    keyboards=["contact_request", "about", "sites", "contacts", "cost_intro", "design_intro"],
 )
+menu = TextRouter(content.current.menu)
 
 
-DESIGN_INTRO_PHOTO = "https://ovikv.ru/new/img/podho_130325114/16.jpg"
-DESIGN_INTRO_TEXT = (
-    "📐 Архитектурное проектирование\n\n"
-    "🏗 Разработаем полный проект и 3D-визуал вашего дома по СНиП\n"
-    "💰 Стоимость от 400 руб/м² · Срок — до 30 дней\n"
-    "Рассчитаем смету будущего строительства!\n\n"
-    "Мы поможем вам сэкономить до 1 млн рублей за счёт правильного подбора материалов, инженерных решений и грамотной структуры проекта.\n\n"
-    "Чтобы рассчитать стоимость проектирования и подготовить персональное предложение — ответьте на несколько коротких вопросов. Это займёт меньше минуты ⏱"
-)
+def get_admin_chat_id() -> Optional[int]:
+    if ADMIN_CHAT_ID and ADMIN_CHAT_ID.isdigit():
+        return int(ADMIN_CHAT_ID)
+    return None
 
 
-def main_menu() -> ReplyKeyboardMarkup:
-    keyboard = ReplyKeyboardMarkup(resize_keyboard=True)
-    for row in MAIN_MENU_BUTTONS:
-        keyboard.row(*row)
-    return keyboard
+def notify_admin(text: str) -> None:
+    admin_chat_id = get_admin_chat_id()
+    if admin_chat_id:
+        outbox.put(admin_chat_id, text)
 
 
-def contact_request_keyboard() -> ReplyKeyboardMarkup:
-    keyboard = ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True)
-    keyboard.add(types.KeyboardButton("📲 Отправить контакт", request_contact=True))
-    return keyboard
+def is_admin(message: types.Message) -> bool:
+    return message.chat.id == get_admin_chat_id()
 
 
-def about_keyboard() -> InlineKeyboardMarkup:
-    keyboard = InlineKeyboardMarkup()
-    keyboard.add(InlineKeyboardButton(text="📝 Оставить заявку", callback_data="lead"))
-    keyboard.add(InlineKeyboardButton(text="💬 Написать менеджеру", url="https://t.me/wmeste851"))
-    return keyboard
+def broadcast_finished(report: BroadcastReport) -> None:
+    notify_admin(str(report))
 
 
-def sites_keyboard() -> InlineKeyboardMarkup:
-    keyboard = InlineKeyboardMarkup()
-    keyboard.add(InlineKeyboardButton(text="🏠 Основной сайт", url="https://ск-вместе.рф"))
-    keyboard.add(InlineKeyboardButton(text="📐 Проектирование", url="https://ск-вместе-проектирование.рф"))
-    return keyboard
+def quiz_completed(message: types.Message, quiz: str, answers: dict) -> None:
+    lead = leads.add(quiz, message.chat.id, message.from_user.full_name, answers["phone"], answers)
+    if not lead.duplicate:
+        notify_admin(quizzes.summary(quiz, {**answers, "phone": lead.display_phone}))
 
 
-def contacts_keyboard() -> InlineKeyboardMarkup:
-    keyboard = InlineKeyboardMarkup()
-    keyboard.add(InlineKeyboardButton(text="💬 Написать нам", url="https://t.me/wmeste851"))
-    keyboard.add(InlineKeyboardButton(text="📣 Telegram-канал", url="https://t.me/skVmeste"))
-    keyboard.add(InlineKeyboardButton(text="🟢 WhatsApp", url="https://wa.me/79286211105"))
-    # keyboard.add(InlineKeyboardButton(text="📞 Позвонить — tel:+79286211105", url="tel:+79286211105"))
-    return keyboard
+quizzes = QuizEngine.load(
+    QUIZZES_PATH,
+    phone_markup=content.current.markups["contact_request"],
+    done_markup=content.current.markups["main_menu"],
+    done_text=content.current.texts["done"],
+    on_complete=quiz_completed,
+    on_step=metrics.quiz_step,
+)
 
 
-def cost_intro_keyboard() -> InlineKeyboardMarkup:
-    keyboard = InlineKeyboardMarkup()
-    keyboard.add(InlineKeyboardButton(text="➡️ Рассчитать стоимость дома", callback_data="cost_quiz_start"))
-    return keyboard
+def check_callbacks(page: Content) -> None:
+    # Inline buttons may only point at callbacks some handler answers.
+    known = {"lead", *quizzes.starts}
+    for name, markup in page.markups.items():
+        for row in json.loads(markup).get("inline_keyboard", []):
+            for button in row:
+                if "callback_data" in button and button["callback_data"] not in known:
+                    raise ContentError(f"Keyboard {name!r} has an unknown callback_data {button['callback_data']!r}")
 
 
-def design_intro_keyboard() -> InlineKeyboardMarkup:
-    keyboard = InlineKeyboardMarkup()
-    keyboard.add(InlineKeyboardButton(text="📐 Рассчитать стоимость проекта", callback_data="design_quiz_start"))
-    return keyboard
+def apply_content(page: Content) -> None:
+    menu.set_buttons(page.menu)
+    quizzes.set_markups(page.markups["contact_request"], page.markups["main_menu"], page.texts["done"])
 
 
-def question_keyboard(options: list[str]) -> ReplyKeyboardMarkup:
-    keyboard = ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True)
-    for option in options:
-        keyboard.add(option)
-    return keyboard
+async def quiz_abandoned(chat_id: int, user_id: int, state: str, data: dict) -> None:
+    await quizzes.remind(bot, chat_id, state, content.current.texts["reminder"])
+    if FOLLOWUP_NOTIFY_ADMIN:
+        user_link = f"<a href='tg://user?id={user_id}'>{user_id}</a>"
+        notify_admin(f"Незавершённая анкета от {user_link}\n{quizzes.partial_summary(state, data)}")
 
 
-def get_admin_chat_id() -> Optional[int]:
-    if ADMIN_CHAT_ID and ADMIN_CHAT_ID.isdigit():
-        return int(ADMIN_CHAT_ID)
-    return None
+followups = FollowUps(
+    FOLLOWUPS_PATH,
+    storage,
+    states=[f"{name}:" for name in quizzes.names],
+    on_idle=quiz_abandoned,
+    idle=FOLLOWUP_IDLE,
+    expire_after=FOLLOWUP_EXPIRE,
+)
+dp.middleware.setup(FollowUpMiddleware(followups))
+metrics.gauge("bot_fsm_sessions", lambda: count_states(storage, prefix=tuple(f"{name}:" for name in quizzes.names)))
 
 
 @dp.message_handler(commands=["start"])
-async def start_command(message: types.Message) -> None:
-    await message.answer(START_MESSAGE, reply_markup=main_menu())
+async def start_command(message: types.Message):
+    chat_registry.add(message.chat.id)
+    page = content.current
+    return await reply(message, page.texts["start"], reply_markup=page.markups["main_menu"])
+
+
+@dp.message_handler(is_admin, commands=["broadcast"])
+async def broadcast_command(message: types.Message):
+    # Reply to a photo with /broadcast to send the photo with the text as its caption.
+    text = message.get_args()
+    source = message.reply_to_message
+    photo = source.photo[-1].file_id if source and source.photo else None
+    if not text:
+        return await reply(message, "Напишите текст рассылки после команды: /broadcast текст")
+    # Only the process that started the broadcaster sends; in sharded mode that is the front end.
+    broadcast_id = chat_registry.create_broadcast(text, photo)
+    broadcaster.notify()
+    return await reply(message, f"Рассылка #{broadcast_id} поставлена в очередь, получателей: {chat_registry.count()}")
+
+
+@dp.message_handler(is_admin, commands=["leads"])
+async def leads_command(message: types.Message) -> None:
+    # /leads [csv|json] [days]
+    args = message.get_args().split()
+    fmt = "json" if "json" in args else "csv"
+    days = next((int(arg) for arg in args if arg.isdigit()), None)
+    buffer = io.StringIO()
+    count = await leads.export(buffer, fmt, since=time.time() - days * 86400 if days else None)
+    # The BOM lets Excel open the Cyrillic CSV correctly.
+    payload = buffer.getvalue().encode("utf-8-sig" if fmt == "csv" else "utf-8")
+    await message.answer_document(types.InputFile(io.BytesIO(payload), filename=f"leads.{fmt}"), caption=f"Заявок: {count}")
+
+
+@dp.message_handler(is_admin, commands=["reload"])
+async def reload_command(message: types.Message):
+    try:
+        changed = content.reload(force=True)
+    except ContentError as error:
+        return await reply(message, f"⚠️ Контент не обновлён, работает прежняя версия.\nОшибка: {quote_html(str(error))}")
+    return await reply(message, "✅ Контент обновлён" if changed else "Контент не изменился")
 
 
 @dp.message_handler(commands=["lead"])
 async def lead_command(message: types.Message) -> None:
     await LeadForm.waiting_for_name.set()
-    await message.answer("Шаг 1 – как вас зовут?", reply_markup=ReplyKeyboardRemove())
+    await message.answer(content.current.texts["lead_name"], reply_markup=ReplyKeyboardRemove())
 
 
 @dp.callback_query_handler(text="lead")
 async def lead_from_callback(callback_query: CallbackQuery) -> None:
     await callback_query.answer()
     await LeadForm.waiting_for_name.set()
-    await callback_query.message.answer("Шаг 1 – как вас зовут?", reply_markup=ReplyKeyboardRemove())
+    await callback_query.message.answer(content.current.texts["lead_name"], reply_markup=ReplyKeyboardRemove())
 
 
 @dp.message_handler(state=LeadForm.waiting_for_name, content_types=ContentType.TEXT)
 async def lead_name(message: types.Message, state: FSMContext) -> None:
     await state.update_data(name=message.text.strip())
     await LeadForm.waiting_for_contact.set()
-    await message.answer("Шаг 2 – отправьте телефон", reply_markup=contact_request_keyboard())
+    page = content.current
+    await message.answer(page.texts["lead_phone"], reply_markup=page.markups["contact_request"])
 
 
 @dp.message_handler(state=LeadForm.waiting_for_contact, content_types=[ContentType.CONTACT, ContentType.TEXT])
 async def lead_contact(message: types.Message, state: FSMContext) -> None:
     data = await state.get_data()
     name = data.get("name", "")
-    phone = message.contact.phone_number if message.contact else message.text.strip()
-    admin_chat_id = get_admin_chat_id()
-    if admin_chat_id:
-        await bot.send_message(admin_chat_id, f"Новая заявка\nИмя: {name}\nТелефон: {phone}")
-    await message.answer("✅ Спасибо! Мы свяжемся с вами.", reply_markup=main_menu())
+    lead = leads.add("lead", message.chat.id, name, message_phone(message))
+    if not lead.duplicate:
+        notify_admin(f"Новая заявка\nИмя: {quote_html(name)}\nТелефон: {quote_html(lead.display_phone)}")
+    page = content.current
+    await message.answer(page.texts["done"], reply_markup=page.markups["main_menu"])
     await state.finish()
 
 
-@dp.message_handler(lambda msg: msg.text == "📋 О компании")
-async def about_company(message: types.Message) -> None:
-    await message.answer(ABOUT_TEXT, reply_markup=about_keyboard())
+@menu.route("about")
+async def about_company(message: types.Message):
+    page = content.current
+    return await reply(message, page.texts["about"], reply_markup=page.markups["about"])
 
 
-@dp.message_handler(lambda msg: msg.text == "📁 Каталог проектов")
-async def catalog_handler(message: types.Message) -> None:
-    await message.answer(CATALOG_TEXT)
+@menu.route("catalog")
+async def catalog_handler(message: types.Message):
+    return await reply(message, content.current.texts["catalog"])
 
 
-@dp.message_handler(lambda msg: msg.text == "🌐 Сайты компании")
-async def sites_handler(message: types.Message) -> None:
-    await message.answer("Выберите сайт:", reply_markup=sites_keyboard())
+@menu.route("sites")
+async def sites_handler(message: types.Message):
+    page = content.current
+    return await reply(message, page.texts["sites"], reply_markup=page.markups["sites"])
 
 
-@dp.message_handler(lambda msg: msg.text == "📞 Контакты")
-async def contacts_handler(message: types.Message) -> None:
-    await message.answer(CONTACTS_TEXT, reply_markup=contacts_keyboard())
+@menu.route("contacts")
+async def contacts_handler(message: types.Message):
+    page = content.current
+    return await reply(message, page.texts["contacts"], reply_markup=page.markups["contacts"])
 
 
-@dp.message_handler(lambda msg: msg.text == "🏗 Расчёт стоимости дома")
+@menu.route("cost")
 async def cost_intro(message: types.Message) -> None:
-    await bot.send_photo(message.chat.id, COST_INTRO_PHOTO, caption=COST_INTRO_TEXT, reply_markup=cost_intro_keyboard())
-
-
-@dp.callback_query_handler(text="cost_quiz_start")
-async def start_cost_quiz(callback_query: CallbackQuery) -> None:
-    await callback_query.answer()
-    await CostQuiz.floors.set()
-    options = ["1 этаж", "С мансардой", "2 этажа"]
-    await callback_query.message.answer("1️⃣ Сколько этажей будет в доме?", reply_markup=question_keyboard(options))
-
-
-@dp.message_handler(state=CostQuiz.floors, content_types=ContentType.TEXT)
-async def cost_floors(message: types.Message, state: FSMContext) -> None:
-    await state.update_data(floors=message.text)
-    await CostQuiz.material.set()
-    options = ["Кирпич", "Каркас / Брус", "Газобетон / Монолит", "Пока не определился, нужна консультация"]
-    await message.answer("2️⃣ Из какого материала планируете строить дом?", reply_markup=question_keyboard(options))
-
-
-@dp.message_handler(state=CostQuiz.material, content_types=ContentType.TEXT)
-async def cost_material(message: types.Message, state: FSMContext) -> None:
-    await state.update_data(material=message.text)
-    await CostQuiz.area.set()
-    options = ["до 100 м²", "100–150 м²", "150–200 м²", "Больше 200 м²"]
-    await message.answer("3️⃣ Какую общую площадь вы рассматриваете?", reply_markup=question_keyboard(options))
-
-
-@dp.message_handler(state=CostQuiz.area, content_types=ContentType.TEXT)
-async def cost_area(message: types.Message, state: FSMContext) -> None:
-    await state.update_data(area=message.text)
-    await CostQuiz.project.set()
-    options = ["Есть готовый проект", "Есть картинка, рисунок, чертеж", "Выберу из каталога", "Хочу индивидуальный проект (бесплатно)"]
-    await message.answer("4️⃣ У вас есть проект, который нравится?", reply_markup=question_keyboard(options))
-
-
-@dp.message_handler(state=CostQuiz.project, content_types=ContentType.TEXT)
-async def cost_project(message: types.Message, state: FSMContext) -> None:
-    await state.update_data(project=message.text)
-    await CostQuiz.timeline.set()
-    options = ["В ближайшее время", "Через 1–3 месяца", "Через 3–6 месяцев", "Не знаю, нужна консультация"]
-    await message.answer("5️⃣ Когда планируете строительство?", reply_markup=question_keyboard(options))
-
-
-@dp.message_handler(state=CostQuiz.timeline, content_types=ContentType.TEXT)
-async def cost_timeline(message: types.Message, state: FSMContext) -> None:
-    await state.update_data(timeline=message.text)
-    await CostQuiz.phone.set()
-    await message.answer("6️⃣ Телефон:\n📲 Оставьте телефон — мы подготовим расчёт стоимости и свяжемся с вами.", reply_markup=contact_request_keyboard())
-
-
-@dp.message_handler(state=CostQuiz.phone, content_types=[ContentType.CONTACT, ContentType.TEXT])
-async def cost_phone(message: types.Message, state: FSMContext) -> None:
-    data = await state.get_data()
-    phone = message.contact.phone_number if message.contact else message.text.strip()
-    admin_chat_id = get_admin_chat_id()
-    summary = (
-        "Анкета — Расчёт стоимости дома\n"
-        f"Этажность: {data.get('floors')}\n"
-        f"Материал: {data.get('material')}\n"
-        f"Площадь: {data.get('area')}\n"
-        f"Проект: {data.get('project')}\n"
-        f"Сроки: {data.get('timeline')}\n"
-        f"Телефон: {phone}"
+    page = content.current
+    await media_cache.send_photo(
+        bot, message.chat.id, page.photos["cost_intro"], caption=page.texts["cost_intro"], reply_markup=page.markups["cost_intro"]
     )
-    if admin_chat_id:
-        await bot.send_message(admin_chat_id, summary)
-    await message.answer("✅ Спасибо! Мы свяжемся с вами.", reply_markup=main_menu())
-    await state.finish()
 
 
-@dp.message_handler(lambda msg: msg.text == "✏️ Архитектурное проектирование")
+@menu.route("design")
 async def design_intro(message: types.Message) -> None:
-    await bot.send_photo(message.chat.id, DESIGN_INTRO_PHOTO, caption=DESIGN_INTRO_TEXT, reply_markup=design_intro_keyboard())
-
-
-@dp.callback_query_handler(text="design_quiz_start")
-async def start_design_quiz(callback_query: CallbackQuery) -> None:
-    await callback_query.answer()
-    await DesignQuiz.material.set()
-    options = ["Кирпич", "Каркас / Брус", "Газобетон / Монолит", "Пока не определился, нужна консультация"]
-    await callback_query.message.answer("1️⃣ Из какого материала планируете строить?", reply_markup=question_keyboard(options))
+    page = content.current
+    await media_cache.send_photo(
+        bot, message.chat.id, page.photos["design_intro"], caption=page.texts["design_intro"], reply_markup=page.markups["design_intro"]
+    )
 
 
-@dp.message_handler(state=DesignQuiz.material, content_types=ContentType.TEXT)
-async def design_material(message: types.Message, state: FSMContext) -> None:
-    await state.update_data(material=message.text)
-    await DesignQuiz.floors.set()
-    options = ["1 этаж", "2 этажа", "3 этажа", "Другое"]
-    await message.answer("2️⃣ Сколько этажей будет в доме?", reply_markup=question_keyboard(options))
+menu.register(dp)
+quizzes.register(dp)
+content.add_validator(lambda page: menu.check(page.menu))
+content.add_validator(check_callbacks)
+content.on_swap(apply_content)
 
 
-@dp.message_handler(state=DesignQuiz.floors, content_types=ContentType.TEXT)
-async def design_floors(message: types.Message, state: FSMContext) -> None:
-    await state.update_data(floors=message.text)
-    await DesignQuiz.area.set()
-    options = ["до 150 м²", "до 250 м²", "до 500 м²", "Более 500 м²"]
-    await message.answer("3️⃣ Какую общую площадь вы рассматриваете?", reply_markup=question_keyboard(options))
+@dp.message_handler()
+async def fallback(message: types.Message):
+    page = content.current
+    return await reply(message, page.texts["fallback"], reply_markup=page.markups["main_menu"])
 
 
-@dp.message_handler(state=DesignQuiz.area, content_types=ContentType.TEXT)
-async def design_area(message: types.Message, state: FSMContext) -> None:
-    await state.update_data(area=message.text)
-    await DesignQuiz.draft.set()
-    options = ["Да, есть проект, который нравится", "Есть картинка, рисунок, фото", "Выберу из каталога", "Нет"]
-    await message.answer("4️⃣ Есть ли у вас эскиз-проект, который нравится?", reply_markup=question_keyboard(options))
+async def on_startup(dispatcher: Dispatcher) -> None:
+    if METRICS_PORT:
+        await start_metrics_server(WEBAPP_HOST, METRICS_PORT)
+    outbox.start(bot)
+    if RUN_MODE != "sharded":
+        # Shard workers run the follow-ups for their own chats.
+        followups.start()
+    broadcaster.start(bot, on_report=broadcast_finished)
+    content.start()
+    warmup = asyncio.create_task(media_cache.warm(bot, get_admin_chat_id(), content.current.photos.values()))
+    background_tasks.add(warmup)
+    warmup.add_done_callback(background_tasks.discard)
 
 
-@dp.message_handler(state=DesignQuiz.draft, content_types=ContentType.TEXT)
-async def design_draft(message: types.Message, state: FSMContext) -> None:
-    await state.update_data(draft=message.text)
-    await DesignQuiz.timeline.set()
-    options = ["В ближайшее время", "Через 1–3 месяца", "Через 3–6 месяцев", "Не знаю, нужна консультация"]
-    await message.answer("5️⃣ Когда вы планируете строительство?", reply_markup=question_keyboard(options))
+async def on_shutdown(dispatcher: Dispatcher) -> None:
+    await content.stop()
+    await broadcaster.stop()
+    await followups.stop()
+    await leads.close()
+    await outbox.stop()
 
 
-@dp.message_handler(state=DesignQuiz.timeline, content_types=ContentType.TEXT)
-async def design_timeline(message: types.Message, state: FSMContext) -> None:
-    await state.update_data(timeline=message.text)
-    await DesignQuiz.phone.set()
-    await message.answer("6️⃣ Телефон:\n📲 Оставьте ваш телефон для связи.", reply_markup=contact_request_keyboard())
+async def flush_stores(dispatcher: Dispatcher) -> None:
+    # Runs before updates are marked done in the journal, see updates.Checkpoint.
+    if isinstance(dispatcher.storage, SQLiteStorage):
+        await dispatcher.storage.flush()
+    await followups.flush()
+    await leads.flush()
 
 
-@dp.message_handler(state=DesignQuiz.phone, content_types=[ContentType.CONTACT, ContentType.TEXT])
-async def design_phone(message: types.Message, state: FSMContext) -> None:
-    data = await state.get_data()
-    phone = message.contact.phone_number if message.contact else message.text.strip()
-    admin_chat_id = get_admin_chat_id()
-    summary = (
-        "Анкета — Архитектурное проектирование\n"
-        f"Материал: {data.get('material')}\n"
-        f"Этажи: {data.get('floors')}\n"
-        f"Площадь: {data.get('area')}\n"
-        f"Эскиз: {data.get('draft')}\n"
-        f"Сроки: {data.get('timeline')}\n"
-        f"Телефон: {phone}"
-    )
-    if admin_chat_id:
-        await bot.send_message(admin_chat_id, summary)
-    await message.answer("✅ Спасибо! Мы свяжемся с вами.", reply_markup=main_menu())
-    await state.finish()
+async def on_worker_startup(dispatcher: Dispatcher, shard: int, workers: int) -> None:
+    if METRICS_PORT:
+        # Handlers and API calls run in the workers, so each one serves its own metrics.
+        await start_metrics_server(WEBAPP_HOST, METRICS_PORT + 1 + shard)
+    followups.start(shard, workers)
+    content.start()
 
 
-@dp.message_handler()
-async def fallback(message: types.Message) -> None:
-    await message.answer("Выберите действие из меню ниже 👇", reply_markup=main_menu())
+async def on_worker_shutdown(dispatcher: Dispatcher) -> None:
+    await content.stop()
+    await followups.stop()
+    await leads.close()
 
 
 def main() -> None:
-    executor.start_polling(dp, skip_updates=True)
+    if RUN_MODE == "webhook":
+        if not WEBHOOK_URL:
+            raise RuntimeError("WEBHOOK_URL is not set")
+        start_webhook(
+            dp,
+            url=WEBHOOK_URL,
+            path=WEBHOOK_PATH,
+            secret=WEBHOOK_SECRET,
+            concurrency=WEBHOOK_CONCURRENCY,
+            host=WEBAPP_HOST,
+            port=WEBAPP_PORT,
+            on_startup=on_startup,
+            on_shutdown=on_shutdown,
+        )
+    elif RUN_MODE == "sharded":
+        run_sharded(
+            dp,
+            module_name="bot",
+            workers=SHARD_WORKERS,
+            queue_size=SHARD_QUEUE_SIZE,
+            journal_path=UPDATES_JOURNAL_PATH,
+            drain_timeout=DRAIN_TIMEOUT,
+            on_startup=on_startup,
+            on_shutdown=on_shutdown,
+            worker_startup="on_worker_startup",
+            worker_shutdown="on_worker_shutdown",
+            worker_flush="flush_stores",
+        )
+    else:
+        run_polling(
+            dp,
+            journal_path=UPDATES_JOURNAL_PATH,
+            drain_timeout=DRAIN_TIMEOUT,
+            on_startup=on_startup,
+            on_shutdown=on_shutdown,
+            flush=flush_stores,
+        )
 
 
 if __name__ == "__main__":
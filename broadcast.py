@@ -0,0 +1,282 @@
+import asyncio
+import logging
+import sqlite3
+import time
+from dataclasses import dataclass
+from typing import Callable, Iterator, Optional
+
+from aiogram import Bot
+from aiogram.utils.exceptions import (
+    BotBlocked,
+    BotKicked,
+    CantInitiateConversation,
+    CantTalkWithBots,
+    ChatNotFound,
+    GroupDeactivated,
+    RetryAfter,
+    TelegramAPIError,
+    UserDeactivated,
+)
+
+from media_cache import MediaCache
+
+log = logging.getLogger(__name__)
+
+# The chat is gone for good: sending there again can never succeed.
+UNREACHABLE = (BotBlocked, BotKicked, CantInitiateConversation, CantTalkWithBots, ChatNotFound, GroupDeactivated, UserDeactivated)
+
+
+@dataclass
+class BroadcastReport:
+    broadcast_id: int
+    sent: int = 0
+    pruned: int = 0
+    failed: int = 0
+    elapsed: float = 0.0
+
+    @property
+    def rate(self) -> float:
+        return self.sent / self.elapsed if self.elapsed else 0.0
+
+    def __str__(self) -> str:
+        return (
+            f"Рассылка #{self.broadcast_id} завершена\n"
+            f"Доставлено: {self.sent}\nУдалено из базы: {self.pruned}\nОшибок: {self.failed}\n"
+            f"Скорость: {self.rate:.1f} сообщ./с за {self.elapsed:.0f} с"
+        )
+
+
+class ChatRegistry:
+    """
+    Every chat that has pressed /start, plus the progress of each broadcast to them.
+
+    Chats are kept ordered by id, so a broadcast walks the table in chunks with a plain
+    ``chat_id > cursor`` range scan and checkpoints the cursor after every chunk.
+    """
+
+    def __init__(self, path: str) -> None:
+        self._db = sqlite3.connect(path, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS chats (chat_id INTEGER PRIMARY KEY)")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS broadcasts ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, text TEXT NOT NULL, photo TEXT, cursor INTEGER, "
+            "sent INTEGER NOT NULL DEFAULT 0, pruned INTEGER NOT NULL DEFAULT 0, failed INTEGER NOT NULL DEFAULT 0, "
+            "elapsed REAL NOT NULL DEFAULT 0, created_at REAL NOT NULL, finished_at REAL)"
+        )
+
+    def add(self, chat_id: int) -> None:
+        self._db.execute("INSERT OR IGNORE INTO chats (chat_id) VALUES (?)", (chat_id,))
+
+    def remove(self, chat_ids: list[int]) -> None:
+        self._db.executemany("DELETE FROM chats WHERE chat_id = ?", [(chat_id,) for chat_id in chat_ids])
+
+    def count(self) -> int:
+        return self._db.execute("SELECT COUNT(*) FROM chats").fetchone()[0]
+
+    def chunks(self, after: Optional[int], size: int) -> Iterator[list[int]]:
+        cursor = after if after is not None else -(2**63)
+        while True:
+            chunk = [
+                chat_id
+                for (chat_id,) in self._db.execute(
+                    "SELECT chat_id FROM chats WHERE chat_id > ? ORDER BY chat_id LIMIT ?", (cursor, size)
+                )
+            ]
+            if not chunk:
+                return
+            yield chunk
+            cursor = chunk[-1]
+
+    def create_broadcast(self, text: str, photo: Optional[str] = None) -> int:
+        return self._db.execute(
+            "INSERT INTO broadcasts (text, photo, created_at) VALUES (?, ?, ?)", (text, photo, time.time())
+        ).lastrowid
+
+    def broadcast(self, broadcast_id: int) -> tuple[str, Optional[str], Optional[int], BroadcastReport]:
+        text, photo, cursor, sent, pruned, failed, elapsed = self._db.execute(
+            "SELECT text, photo, cursor, sent, pruned, failed, elapsed FROM broadcasts WHERE id = ?", (broadcast_id,)
+        ).fetchone()
+        return text, photo, cursor, BroadcastReport(broadcast_id, sent, pruned, failed, elapsed)
+
+    def unfinished(self) -> list[int]:
+        return [broadcast_id for (broadcast_id,) in self._db.execute("SELECT id FROM broadcasts WHERE finished_at IS NULL ORDER BY id")]
+
+    def checkpoint(self, cursor: Optional[int], report: BroadcastReport, finished: bool = False) -> None:
+        self._db.execute(
+            "UPDATE broadcasts SET cursor = ?, sent = ?, pruned = ?, failed = ?, elapsed = ?, finished_at = ? WHERE id = ?",
+            (
+                cursor,
+                report.sent,
+                report.pruned,
+                report.failed,
+                report.elapsed,
+                time.time() if finished else None,
+                report.broadcast_id,
+            ),
+        )
+
+    def close(self) -> None:
+        self._db.close()
+
+
+class TokenBucket:
+    """Hands out ``rate`` tokens per second, at most ``burst`` at once, to waiters in FIFO order."""
+
+    def __init__(self, rate: float, burst: int = 1) -> None:
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float) -> None:
+        # Telegram's flood wait applies to the whole bot, so nobody sends until it is over.
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0.0
+        self._updated = self._paused_until
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._tokens = min(self.burst, self._tokens + max(0.0, now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class Broadcaster:
+    """
+    Sends one message to every registered chat under Telegram's broadcast limits.
+
+    A global token bucket keeps the bot under ``rate`` messages per second and a chat never
+    gets two messages (photo, then text) closer than ``per_chat_interval``. RetryAfter pauses
+    the bucket and retries the chat; chats that blocked the bot are pruned from the registry.
+    Progress is checkpointed after every chunk, so an interrupted broadcast resumes where it
+    stopped and re-sends at most one chunk. Broadcasts run one at a time.
+
+    Only one process may send: the rate limit is per process, and two senders would exceed
+    Telegram's global limit together. ``start`` runs every unfinished broadcast in the registry
+    from the calling process; everyone else only records new ones with ``create_broadcast``.
+    """
+
+    def __init__(
+        self,
+        registry: ChatRegistry,
+        media_cache: Optional[MediaCache] = None,
+        rate: float = 25.0,
+        per_chat_interval: float = 1.0,
+        chunk_size: int = 500,
+        max_retries: int = 3,
+        poll_interval: float = 5.0,
+    ) -> None:
+        self.registry = registry
+        self.media_cache = media_cache
+        self.per_chat_interval = per_chat_interval
+        self.chunk_size = chunk_size
+        self.max_retries = max_retries
+        self.poll_interval = poll_interval
+        self.bucket = TokenBucket(rate)
+        self._lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._server: Optional[asyncio.Task] = None
+
+    async def run(self, bot: Bot, broadcast_id: int) -> BroadcastReport:
+        async with self._lock:
+            text, photo, cursor, report = self.registry.broadcast(broadcast_id)
+            log.info("Broadcast #%d starting after chat %s", broadcast_id, cursor)
+            for chunk in self.registry.chunks(cursor, self.chunk_size):
+                started = time.perf_counter()
+                tasks = []
+                for chat_id in chunk:
+                    await self.bucket.acquire()
+                    tasks.append(asyncio.create_task(self._deliver(bot, chat_id, text, photo)))
+                outcomes = await asyncio.gather(*tasks)
+                unreachable = [chat_id for chat_id, outcome in zip(chunk, outcomes) if outcome is None]
+                self.registry.remove(unreachable)
+                report.sent += outcomes.count(True)
+                report.failed += outcomes.count(False)
+                report.pruned += len(unreachable)
+                report.elapsed += time.perf_counter() - started
+                cursor = chunk[-1]
+                self.registry.checkpoint(cursor, report)
+            self.registry.checkpoint(cursor, report, finished=True)
+            log.info("Broadcast #%d: %d sent, %d pruned, %d failed, %.1f msg/s", broadcast_id, report.sent, report.pruned, report.failed, report.rate)
+            return report
+
+    async def resume(self, bot: Bot) -> list[BroadcastReport]:
+        return [await self.run(bot, broadcast_id) for broadcast_id in self.registry.unfinished()]
+
+    def start(self, bot: Bot, on_report: Optional[Callable[[BroadcastReport], None]] = None) -> None:
+        if self._server is None:
+            self._server = asyncio.create_task(self._serve(bot, on_report))
+
+    def notify(self) -> None:
+        """Look for new broadcasts now instead of at the next poll."""
+        self._wakeup.set()
+
+    async def stop(self) -> None:
+        # The cursor is checkpointed after every chunk, so the broadcast resumes after the restart.
+        if self._server is not None:
+            self._server.cancel()
+            self._server = None
+
+    async def _serve(self, bot: Bot, on_report: Optional[Callable[[BroadcastReport], None]]) -> None:
+        while True:
+            self._wakeup.clear()
+            for broadcast_id in self.registry.unfinished():
+                try:
+                    report = await self.run(bot, broadcast_id)
+                except Exception:
+                    log.exception("Broadcast #%d failed, retrying in %.0f s", broadcast_id, self.poll_interval)
+                    break
+                if on_report is not None:
+                    on_report(report)
+            # Shard workers record broadcasts in their own process, so do not rely on the event alone.
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _deliver(self, bot: Bot, chat_id: int, text: str, photo: Optional[str]) -> Optional[bool]:
+        """True when delivered, False on a failure worth keeping the chat for, None if the chat is unreachable."""
+        try:
+            if photo and len(text) <= 1024:
+                await self._send(bot, chat_id, photo, caption=text)
+                return True
+            if photo:
+                await self._send(bot, chat_id, photo)
+                await asyncio.sleep(self.per_chat_interval)
+                await self.bucket.acquire()
+            await self._send(bot, chat_id, None, text=text)
+            return True
+        except UNREACHABLE:
+            return None
+        except (TelegramAPIError, OSError, asyncio.TimeoutError) as error:
+            log.warning("Broadcast to %s failed: %s", chat_id, error)
+            return False
+
+    async def _send(self, bot: Bot, chat_id: int, photo: Optional[str], **kwargs) -> None:
+        for attempt in range(self.max_retries + 1):
+            try:
+                if photo is None:
+                    await bot.send_message(chat_id, **kwargs)
+                elif self.media_cache is not None:
+                    await self.media_cache.send_photo(bot, chat_id, photo, **kwargs)
+                else:
+                    await bot.send_photo(chat_id, photo, **kwargs)
+                return
+            except RetryAfter as error:
+                if attempt == self.max_retries:
+                    raise
+                log.warning("Broadcast throttled, pausing for %s s", error.timeout)
+                self.bucket.pause(error.timeout)
+                await self.bucket.acquire()
@@ -0,0 +1,171 @@
+import asyncio
+import json
+import logging
+import os
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Callable, Iterable, Mapping, Optional
+
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup, KeyboardButton, ReplyKeyboardMarkup
+
+log = logging.getLogger(__name__)
+
+
+class ContentError(ValueError):
+    pass
+
+
+@dataclass(frozen=True)
+class Content:
+    """One loaded version of the content file, with every keyboard already serialized."""
+
+    texts: Mapping[str, str]
+    photos: Mapping[str, str]
+    markups: Mapping[str, str]
+    # menu button id -> label
+    menu: Mapping[str, str]
+    mtime: int
+
+
+def _inline_button(button: dict) -> InlineKeyboardButton:
+    if not button.get("text") or len({"url", "callback_data"} & button.keys()) != 1:
+        raise ContentError(f"Inline button needs a text and exactly one of url/callback_data: {button}")
+    return InlineKeyboardButton(**button)
+
+
+def _reply_button(button) -> KeyboardButton:
+    if isinstance(button, str):
+        return KeyboardButton(button)
+    if not button.get("text"):
+        raise ContentError(f"Keyboard button needs a text: {button}")
+    return KeyboardButton(**{key: value for key, value in button.items() if key != "id"})
+
+
+def render_keyboard(spec: dict) -> str:
+    if "inline" in spec:
+        rows = [[_inline_button(button) for button in row] for row in spec["inline"]]
+        return InlineKeyboardMarkup(inline_keyboard=rows).as_json()
+    rows = [[_reply_button(button) for button in row] for row in spec["reply"]]
+    keyboard = ReplyKeyboardMarkup(keyboard=rows, resize_keyboard=True, one_time_keyboard=spec.get("one_time", False))
+    return keyboard.as_json()
+
+
+def parse(raw: dict, mtime: int = 0) -> Content:
+    menu = {}
+    for row in raw["main_menu"]:
+        for button in row:
+            if button["id"] in menu:
+                raise ContentError(f"Menu button id {button['id']!r} is used twice")
+            menu[button["id"]] = button["text"]
+    markups = {name: render_keyboard(spec) for name, spec in raw.get("keyboards", {}).items()}
+    markups["main_menu"] = render_keyboard({"reply": raw["main_menu"]})
+    return Content(
+        texts=MappingProxyType(dict(raw["texts"])),
+        photos=MappingProxyType(dict(raw.get("photos", {}))),
+        markups=MappingProxyType(markups),
+        menu=MappingProxyType(menu),
+        mtime=mtime,
+    )
+
+
+class ContentStore:
+    """
+    Texts, keyboards, photos and the main menu, loaded from a JSON file and reloadable live.
+
+    ``current`` always points at a complete immutable ``Content``; a reload builds and checks
+    the new version off to the side and swaps it in with a single assignment, so handlers read
+    it without locks. A file that fails to parse or validate is rejected and the last good
+    version stays in place. ``start`` polls the file's mtime; ``reload`` can also be called
+    directly (the admin /reload command).
+    """
+
+    def __init__(
+        self,
+        path: str,
+        texts: Iterable[str] = (),
+        photos: Iterable[str] = (),
+        keyboards: Iterable[str] = (),
+        poll_interval: float = 5.0,
+    ) -> None:
+        self.path = path
+        self.required = {"texts": tuple(texts), "photos": tuple(photos), "markups": tuple(keyboards)}
+        self.validators: list[Callable[[Content], None]] = []
+        self.poll_interval = poll_interval
+        self._listeners: list[Callable[[Content], None]] = []
+        self._rejected_mtime: Optional[int] = None
+        self._poller: Optional[asyncio.Task] = None
+        # No fallback exists yet, so a broken file at startup is fatal.
+        self.current = self._load()
+
+    def _load(self) -> Content:
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+            with open(self.path, encoding="utf-8") as file:
+                content = parse(json.load(file), mtime)
+        except ContentError:
+            raise
+        except (OSError, ValueError, KeyError, TypeError, AttributeError) as error:
+            raise ContentError(f"{type(error).__name__}: {error}") from error
+        for section, keys in self.required.items():
+            missing = [key for key in keys if key not in getattr(content, section)]
+            if missing:
+                raise ContentError(f"Missing {section}: {', '.join(missing)}")
+        for validate in self.validators:
+            try:
+                validate(content)
+            except ContentError:
+                raise
+            except ValueError as error:
+                raise ContentError(str(error)) from error
+        return content
+
+    def on_swap(self, listener: Callable[[Content], None]) -> None:
+        """Call ``listener`` with every version swapped in from now on, and with the current one."""
+        self._listeners.append(listener)
+        listener(self.current)
+
+    def add_validator(self, validate: Callable[[Content], None]) -> None:
+        validate(self.current)
+        self.validators.append(validate)
+
+    def reload(self, force: bool = False) -> bool:
+        """
+        Swap in the file if it changed (or ``force``); returns whether it had changed since the
+        current version. Raises ContentError and keeps the old version if the file is bad.
+        """
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError as error:
+            # A missing or unreadable file is a bad file like any other: the old version stays.
+            raise ContentError(f"{type(error).__name__}: {error}") from error
+        changed = mtime != self.current.mtime
+        if not force and (not changed or mtime == self._rejected_mtime):
+            return False
+        try:
+            content = self._load()
+        except ContentError as error:
+            self._rejected_mtime = mtime
+            log.error("Rejected %s, keeping the version loaded before: %s", self.path, error)
+            raise
+        self.current = content
+        for listener in self._listeners:
+            listener(content)
+        log.info("Loaded new content from %s", self.path)
+        return changed
+
+    def start(self) -> None:
+        if self._poller is None:
+            self._poller = asyncio.create_task(self._poll())
+
+    async def stop(self) -> None:
+        if self._poller is not None:
+            self._poller.cancel()
+            self._poller = None
+
+    async def _poll(self) -> None:
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                self.reload()
+            except ContentError:
+                pass
@@ -0,0 +1,274 @@
+import asyncio
+import logging
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Hashable, Iterable, Optional
+
+from aiogram import types
+from aiogram.dispatcher.middlewares import BaseMiddleware
+from aiogram.dispatcher.storage import BaseStorage
+
+from broadcast import TokenBucket
+
+log = logging.getLogger(__name__)
+
+REMIND = 1
+EXPIRE = 2
+
+Session = tuple[int, int]
+OnIdle = Callable[[int, int, str, dict], Awaitable]
+
+
+class TimingWheel:
+    """
+    Hierarchical timing wheel with ``levels`` wheels of ``2 ** bits`` slots each.
+
+    Scheduling and cancelling a timer are a set insert and a set discard. Level 0 has one slot
+    per tick; a slot on level n covers ``2 ** (bits * n)`` ticks and is cascaded into the
+    level below when the clock reaches it, so each timer is moved at most ``levels`` times.
+    """
+
+    def __init__(self, tick: float = 1.0, bits: int = 6, levels: int = 4, now: Optional[float] = None) -> None:
+        self.tick = tick
+        self.bits = bits
+        self.levels = levels
+        self._mask = (1 << bits) - 1
+        self._span = 1 << (bits * levels)
+        self._wheels: list[list[set]] = [[set() for _ in range(1 << bits)] for _ in range(levels)]
+        self._current = int((time.time() if now is None else now) // tick)
+        self._due: dict[Hashable, int] = {}
+        self._where: dict[Hashable, tuple[int, int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._due)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._due
+
+    def schedule(self, key: Hashable, when: float) -> None:
+        self.cancel(key)
+        due = max(int(-(-when // self.tick)), self._current + 1)
+        self._due[key] = due
+        self._place(key, due)
+
+    def cancel(self, key: Hashable) -> None:
+        if self._due.pop(key, None) is not None:
+            level, slot = self._where.pop(key)
+            self._wheels[level][slot].discard(key)
+
+    def _place(self, key: Hashable, due: int) -> None:
+        # Timers beyond the top wheel wait in its last slot and are re-placed when it cascades.
+        due = min(due, self._current + self._span - 1)
+        level = 0
+        while level < self.levels - 1 and due >> (self.bits * (level + 1)) != self._current >> (self.bits * (level + 1)):
+            level += 1
+        slot = (due >> (self.bits * level)) & self._mask
+        self._wheels[level][slot].add(key)
+        self._where[key] = (level, slot)
+
+    def advance(self, now: float) -> list[Hashable]:
+        """Move the clock to ``now`` and return the keys whose time has come."""
+        expired = []
+        target = int(now // self.tick)
+        while self._current < target:
+            self._current += 1
+            cascade = []
+            for level in range(1, self.levels):
+                if self._current & ((1 << (self.bits * level)) - 1):
+                    break
+                cascade.append(level)
+            for level in reversed(cascade):
+                slot = (self._current >> (self.bits * level)) & self._mask
+                keys, self._wheels[level][slot] = self._wheels[level][slot], set()
+                for key in keys:
+                    self._place(key, self._due[key])
+            slot = self._current & self._mask
+            keys, self._wheels[0][slot] = self._wheels[0][slot], set()
+            for key in keys:
+                if self._due[key] <= self._current:
+                    del self._due[key]
+                    del self._where[key]
+                    expired.append(key)
+                else:
+                    self._place(key, self._due[key])
+        return expired
+
+
+class FollowUps:
+    """
+    Follows up on FSM sessions left idle in one of the tracked states.
+
+    Every update in a tracked state reschedules the session on a timing wheel. After ``idle``
+    seconds without activity ``on_idle`` is called once (at most ``rate`` per second), and
+    ``expire_after`` seconds later the session is finished in storage. Sessions and their
+    deadlines are written to SQLite in one batch per tick on a dedicated thread and reloaded
+    on start. Due sessions are queued and handled by ``workers`` tasks.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        storage: BaseStorage,
+        states: Iterable[str],
+        on_idle: OnIdle,
+        idle: float = 3600,
+        expire_after: float = 86400,
+        rate: float = 20.0,
+        tick: float = 1.0,
+        workers: int = 8,
+    ) -> None:
+        self.storage = storage
+        self.states = tuple(states)
+        self.on_idle = on_idle
+        self.idle = idle
+        self.expire_after = expire_after
+        self.bucket = TokenBucket(rate)
+        self.wheel = TimingWheel(tick)
+        self.workers = workers
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS followups ("
+            "chat INTEGER NOT NULL, user INTEGER NOT NULL, state TEXT NOT NULL, stage INTEGER NOT NULL, due REAL NOT NULL, "
+            "PRIMARY KEY (chat, user)) WITHOUT ROWID"
+        )
+        self._sessions: dict[Session, tuple[str, int]] = {}
+        self._dirty: dict[Session, Optional[tuple[str, int, float]]] = {}
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="followups-sqlite")
+        self._due: asyncio.Queue[Session] = asyncio.Queue()
+        self._tasks: list[asyncio.Task] = []
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def touch(self, chat: int, user: int, state: Optional[str]) -> None:
+        session = (chat, user)
+        if not state or not state.startswith(self.states):
+            if session in self._sessions:
+                self._forget(session)
+            return
+        self._set(session, state, REMIND, time.time() + self.idle)
+
+    def _set(self, session: Session, state: str, stage: int, due: float) -> None:
+        self._sessions[session] = (state, stage)
+        self.wheel.schedule(session, due)
+        self._dirty[session] = (state, stage, due)
+
+    def _forget(self, session: Session) -> None:
+        del self._sessions[session]
+        self.wheel.cancel(session)
+        self._dirty[session] = None
+
+    def start(self, shard: int = 0, shards: int = 1) -> None:
+        """Load pending sessions (only this shard's chats when sharded) and start the clock."""
+        if self._tasks:
+            return
+        rows = self._db.execute(
+            "SELECT chat, user, state, stage, due FROM followups WHERE ((chat % ?) + ?) % ? = ?",
+            (shards, shards, shards, shard),
+        ).fetchall()
+        for chat, user, state, stage, due in rows:
+            session = (chat, user)
+            self._sessions[session] = (state, stage)
+            self.wheel.schedule(session, due)
+        log.info("Loaded %d idle-session follow-up(s)", len(rows))
+        self._tasks.append(asyncio.create_task(self._clock()))
+        self._tasks += [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+        await self.flush()
+        await self._run(self._db.close)
+        self._executor.shutdown()
+
+    def _write_batch(self, batch: dict[Session, Optional[tuple[str, int, float]]]) -> None:
+        self._db.execute("BEGIN")
+        try:
+            self._db.executemany(
+                "INSERT INTO followups (chat, user, state, stage, due) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (chat, user) DO UPDATE SET state = excluded.state, stage = excluded.stage, due = excluded.due",
+                [(*session, *record) for session, record in batch.items() if record is not None],
+            )
+            self._db.executemany(
+                "DELETE FROM followups WHERE chat = ? AND user = ?", [session for session, record in batch.items() if record is None]
+            )
+            self._db.execute("COMMIT")
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    async def flush(self) -> None:
+        if not self._dirty:
+            return
+        batch, self._dirty = self._dirty, {}
+        try:
+            await self._run(self._write_batch, batch)
+        except Exception:
+            log.exception("Failed to save %d follow-up(s), will retry", len(batch))
+            for session, record in batch.items():
+                self._dirty.setdefault(session, record)
+
+    async def _clock(self) -> None:
+        while True:
+            await asyncio.sleep(self.wheel.tick)
+            for session in self.wheel.advance(time.time()):
+                self._due.put_nowait(session)
+            await self.flush()
+
+    async def _work(self) -> None:
+        while True:
+            session = await self._due.get()
+            await self._fire(session)
+
+    async def _fire(self, session: Session) -> None:
+        scheduled = self._sessions.get(session)
+        if scheduled is None:
+            return
+        state, stage = scheduled
+        chat, user = session
+        try:
+            current = await self.storage.get_state(chat=chat, user=user)
+            if self._sessions.get(session) != scheduled:
+                return  # the user came back while we were looking
+            if current != state:
+                self._forget(session)
+                return
+            if stage == EXPIRE:
+                self._forget(session)
+                await self.storage.finish(chat=chat, user=user)
+                return
+            self._set(session, state, EXPIRE, time.time() + self.expire_after)
+            data = await self.storage.get_data(chat=chat, user=user)
+            await self.bucket.acquire()
+            await self.on_idle(chat, user, state, data)
+        except Exception:
+            log.exception("Follow-up for chat %s failed", chat)
+
+
+class FollowUpMiddleware(BaseMiddleware):
+    """Reports the FSM state each message or callback left its session in."""
+
+    def __init__(self, followups: FollowUps) -> None:
+        super().__init__()
+        self.followups = followups
+
+    async def _touch(self, chat: Optional[types.Chat], user: Optional[types.User]) -> None:
+        if chat is None or user is None:
+            return
+        state = await self.followups.storage.get_state(chat=chat.id, user=user.id)
+        self.followups.touch(chat.id, user.id, state)
+
+    async def on_post_process_message(self, message: types.Message, results, data: dict) -> None:
+        await self._touch(message.chat, message.from_user)
+
+    async def on_post_process_callback_query(self, callback_query: types.CallbackQuery, results, data: dict) -> None:
+        if callback_query.message is not None:
+            await self._touch(callback_query.message.chat, callback_query.from_user)
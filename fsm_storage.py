@@ -0,0 +1,235 @@
+import asyncio
+import copy
+import json
+import logging
+import sqlite3
+import time
+import typing
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+from aiogram.contrib.fsm_storage.memory import MemoryStorage
+from aiogram.dispatcher.storage import BaseStorage
+
+log = logging.getLogger(__name__)
+
+Address = tuple[str, str]
+
+
+class SQLiteStorage(BaseStorage):
+    """
+    FSM storage backed by SQLite in WAL mode.
+
+    Reads are served from an in-process cache, writes are collected and flushed in one
+    transaction every ``flush_interval`` seconds. Sessions untouched for ``ttl`` seconds expire.
+    """
+
+    def __init__(self, path: str, ttl: float = 86400, flush_interval: float = 0.05, cache_size: int = 10000) -> None:
+        self.path = path
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self.cache_size = cache_size
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS fsm ("
+            "chat TEXT NOT NULL, user TEXT NOT NULL, state TEXT, data TEXT NOT NULL, expires_at REAL NOT NULL, "
+            "PRIMARY KEY (chat, user)) WITHOUT ROWID"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS fsm_expires_at ON fsm (expires_at)")
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="fsm-sqlite")
+        # address -> [state, data, expires_at]
+        self._cache: OrderedDict[Address, list] = OrderedDict()
+        self._dirty: dict[Address, typing.Optional[list]] = {}
+        self._flusher: typing.Optional[asyncio.Task] = None
+        self._last_sweep = time.monotonic()
+
+    def resolve_address(self, chat, user) -> Address:
+        chat_id, user_id = map(str, self.check_address(chat=chat, user=user))
+        return chat_id, user_id
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    def _select(self, address: Address) -> typing.Optional[tuple]:
+        return self._db.execute(
+            "SELECT state, data, expires_at FROM fsm WHERE chat = ? AND user = ?", address
+        ).fetchone()
+
+    async def _load(self, address: Address) -> list:
+        record = self._cache.get(address)
+        if record is None:
+            row = await self._run(self._select, address)
+            # A write may have landed in the cache while the query was running.
+            record = self._cache.get(address)
+            if record is None:
+                record = [row[0], json.loads(row[1]), row[2]] if row else [None, {}, 0.0]
+                self._cache[address] = record
+        else:
+            self._cache.move_to_end(address)
+        if record[2] and record[2] < time.time():
+            record[:] = [None, {}, 0.0]
+        return record
+
+    def _store(self, address: Address, state: typing.Optional[str], data: dict) -> None:
+        if state is None and not data:
+            record = [None, {}, 0.0]
+            self._dirty[address] = None
+        else:
+            record = [state, data, time.time() + self.ttl]
+            self._dirty[address] = record
+        self._cache[address] = record
+        self._cache.move_to_end(address)
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self.flush_interval)
+        await self.flush()
+
+    def _write_batch(self, batch: dict[Address, typing.Optional[list]], sweep: bool) -> None:
+        upserts = [
+            (chat, user, record[0], json.dumps(record[1], ensure_ascii=False), record[2])
+            for (chat, user), record in batch.items()
+            if record is not None
+        ]
+        deletes = [address for address, record in batch.items() if record is None]
+        self._db.execute("BEGIN")
+        try:
+            if upserts:
+                self._db.executemany(
+                    "INSERT INTO fsm (chat, user, state, data, expires_at) VALUES (?, ?, ?, ?, ?) "
+                    "ON CONFLICT (chat, user) DO UPDATE SET "
+                    "state = excluded.state, data = excluded.data, expires_at = excluded.expires_at",
+                    upserts,
+                )
+            if deletes:
+                self._db.executemany("DELETE FROM fsm WHERE chat = ? AND user = ?", deletes)
+            if sweep:
+                self._db.execute("DELETE FROM fsm WHERE expires_at < ?", (time.time(),))
+            self._db.execute("COMMIT")
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+
+    async def flush(self) -> None:
+        sweep = time.monotonic() - self._last_sweep > 60
+        if not self._dirty and not sweep:
+            return
+        batch, self._dirty = self._dirty, {}
+        try:
+            await self._run(self._write_batch, batch, sweep)
+        except Exception:
+            log.exception("Failed to flush %d FSM records, will retry", len(batch))
+            for address, record in batch.items():
+                self._dirty.setdefault(address, record)
+            return
+        if sweep:
+            self._last_sweep = time.monotonic()
+        self._evict()
+
+    def _evict(self) -> None:
+        now = time.time()
+        for address in [address for address, record in self._cache.items() if record[2] and record[2] < now]:
+            if address not in self._dirty:
+                del self._cache[address]
+        while len(self._cache) > self.cache_size:
+            address = next(iter(self._cache))
+            if address in self._dirty:
+                break
+            del self._cache[address]
+
+    def _count_states(self) -> list[tuple[str, int]]:
+        return self._db.execute(
+            "SELECT state, COUNT(*) FROM fsm WHERE state IS NOT NULL AND expires_at >= ? GROUP BY state", (time.time(),)
+        ).fetchall()
+
+    async def count_states(self) -> dict[str, int]:
+        await self.flush()
+        return dict(await self._run(self._count_states))
+
+    async def get_state(self, *,
+                        chat: typing.Union[str, int, None] = None,
+                        user: typing.Union[str, int, None] = None,
+                        default: typing.Optional[str] = None) -> typing.Optional[str]:
+        record = await self._load(self.resolve_address(chat, user))
+        return record[0] if record[0] is not None else self.resolve_state(default)
+
+    async def get_data(self, *,
+                       chat: typing.Union[str, int, None] = None,
+                       user: typing.Union[str, int, None] = None,
+                       default: typing.Optional[dict] = None) -> typing.Dict:
+        record = await self._load(self.resolve_address(chat, user))
+        return copy.deepcopy(record[1]) if record[1] else (default or {})
+
+    async def set_state(self, *,
+                        chat: typing.Union[str, int, None] = None,
+                        user: typing.Union[str, int, None] = None,
+                        state: typing.AnyStr = None) -> None:
+        address = self.resolve_address(chat, user)
+        record = await self._load(address)
+        self._store(address, self.resolve_state(state), record[1])
+
+    async def set_data(self, *,
+                       chat: typing.Union[str, int, None] = None,
+                       user: typing.Union[str, int, None] = None,
+                       data: typing.Dict = None) -> None:
+        address = self.resolve_address(chat, user)
+        record = await self._load(address)
+        self._store(address, record[0], copy.deepcopy(data) if data else {})
+
+    async def update_data(self, *,
+                          chat: typing.Union[str, int, None] = None,
+                          user: typing.Union[str, int, None] = None,
+                          data: typing.Dict = None, **kwargs) -> None:
+        address = self.resolve_address(chat, user)
+        record = await self._load(address)
+        updated = dict(record[1])
+        updated.update(data or {}, **kwargs)
+        self._store(address, record[0], updated)
+
+    async def reset_state(self, *,
+                          chat: typing.Union[str, int, None] = None,
+                          user: typing.Union[str, int, None] = None,
+                          with_data: typing.Optional[bool] = True) -> None:
+        address = self.resolve_address(chat, user)
+        record = await self._load(address)
+        self._store(address, None, {} if with_data else record[1])
+
+    async def close(self) -> None:
+        if self._flusher is not None:
+            self._flusher.cancel()
+        self._last_sweep = 0
+        await self.flush()
+
+    async def wait_closed(self) -> None:
+        self._executor.shutdown(wait=True)
+        self._db.close()
+
+    def has_bucket(self) -> bool:
+        return False
+
+
+def make_storage(url: str, ttl: float) -> BaseStorage:
+    """Build FSM storage from ``memory://``, ``sqlite:///path/to/file`` or ``redis://host:port/db``."""
+    parsed = urlparse(url)
+    if parsed.scheme == "memory":
+        return MemoryStorage()
+    if parsed.scheme == "sqlite":
+        return SQLiteStorage(parsed.path[1:] or "fsm.sqlite3", ttl=ttl)
+    if parsed.scheme in ("redis", "rediss"):
+        # Needs the optional aioredis dependency; RedisStorage2 keeps TTLs on the server.
+        from aiogram.contrib.fsm_storage.redis import RedisStorage2
+
+        return RedisStorage2(
+            host=parsed.hostname or "localhost",
+            port=parsed.port or 6379,
+            db=int(parsed.path.lstrip("/") or 0),
+            password=parsed.password,
+            ssl=parsed.scheme == "rediss" or None,
+            state_ttl=int(ttl),
+            data_ttl=int(ttl),
+        )
+    raise RuntimeError(f"Unsupported FSM_STORAGE_URL: {url}")
@@ -0,0 +1,209 @@
+import asyncio
+import csv
+import json
+import logging
+import re
+import sqlite3
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Optional, TextIO
+
+log = logging.getLogger(__name__)
+
+EXPORT_FIELDS = ("id", "created_at", "source", "chat_id", "name", "phone", "raw_phone", "duplicate", "answers")
+
+
+# Digits with the usual separators and at most a leading plus: no words, extensions or notes.
+PHONE_SHAPE = re.compile(r"\+?[\d\s()\-]+")
+
+
+def normalize_phone(raw: str, country_code: str = "7") -> Optional[str]:
+    """E.164 form of a phone typed or shared by a user, None if it does not look like one."""
+    raw = raw.strip()
+    if not PHONE_SHAPE.fullmatch(raw):
+        return None
+    digits = re.sub(r"\D", "", raw)
+    if not raw.startswith("+"):
+        # Without a plus, take only the national forms and our country code missing its plus.
+        if len(digits) == 11 and digits[0] == "8" and country_code == "7":
+            # Russian trunk prefix: 8 (928) ... is +7 (928) ...
+            digits = country_code + digits[1:]
+        elif len(digits) == 10 and digits[0] != "0":
+            digits = country_code + digits
+        elif not (digits.startswith(country_code) and len(digits) == len(country_code) + 10):
+            return None
+    if not 8 <= len(digits) <= 15 or digits[0] == "0":
+        return None
+    if digits[0] == "7" and len(digits) != 11:
+        # Russia and Kazakhstan share +7 and a fixed 10-digit national number.
+        return None
+    return "+" + digits
+
+
+@dataclass
+class Lead:
+    source: str
+    chat_id: int
+    name: str
+    raw_phone: str
+    phone: Optional[str]
+    answers: dict = field(default_factory=dict)
+    created_at: float = field(default_factory=time.time)
+    duplicate: bool = False
+
+    @property
+    def display_phone(self) -> str:
+        # Show what the user actually typed whenever it is not the number itself.
+        if self.phone is None or self.phone == self.raw_phone:
+            return self.raw_phone
+        return f"{self.phone} ({self.raw_phone})"
+
+
+class LeadStore:
+    """
+    Embedded lead database with duplicate detection.
+
+    ``add`` only normalizes the phone, checks it against an in-memory index of (source, phone)
+    pairs seen in the last ``dedup_window`` seconds and queues the row, so handlers never wait
+    on disk. The same phone coming in through another form is not a duplicate: its answers are
+    new to the admin. The queue is written in one transaction every ``flush_interval`` seconds
+    on a dedicated thread.
+    Duplicates are stored too, flagged, so the export still shows every submission.
+    """
+
+    def __init__(self, path: str, dedup_window: float = 86400, flush_interval: float = 0.5) -> None:
+        self.dedup_window = dedup_window
+        self.flush_interval = flush_interval
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS leads ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, created_at REAL NOT NULL, source TEXT NOT NULL, "
+            "chat_id INTEGER NOT NULL, name TEXT NOT NULL, phone TEXT, raw_phone TEXT NOT NULL, "
+            "duplicate INTEGER NOT NULL, answers TEXT NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS leads_phone ON leads (phone, created_at)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS leads_created_at ON leads (created_at)")
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="leads-sqlite")
+        self._pending: list[Lead] = []
+        self._flusher: Optional[asyncio.Task] = None
+        # (source, phone) -> time it was last submitted, oldest first
+        self._recent: OrderedDict[tuple[str, str], float] = OrderedDict()
+        for source, phone, created_at in self._db.execute(
+            "SELECT source, phone, MAX(created_at) FROM leads WHERE phone IS NOT NULL AND created_at > ? "
+            "GROUP BY source, phone ORDER BY MAX(created_at)",
+            (time.time() - dedup_window,),
+        ):
+            self._recent[source, phone] = created_at
+
+    def _seen(self, key: tuple[str, str], now: float) -> bool:
+        while self._recent:
+            oldest, created_at = next(iter(self._recent.items()))
+            if now - created_at < self.dedup_window:
+                break
+            del self._recent[oldest]
+        seen = key in self._recent
+        self._recent[key] = now
+        self._recent.move_to_end(key)
+        return seen
+
+    def add(self, source: str, chat_id: int, name: str, raw_phone: str, answers: Optional[dict] = None) -> Lead:
+        lead = Lead(source, chat_id, name, raw_phone, normalize_phone(raw_phone), dict(answers or {}))
+        if lead.phone is not None:
+            lead.duplicate = self._seen((lead.source, lead.phone), lead.created_at)
+        self._pending.append(lead)
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_later())
+        return lead
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self.flush_interval)
+        await self.flush()
+
+    def _write_batch(self, batch: list[Lead]) -> None:
+        self._db.execute("BEGIN")
+        try:
+            self._db.executemany(
+                "INSERT INTO leads (created_at, source, chat_id, name, phone, raw_phone, duplicate, answers) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        lead.created_at,
+                        lead.source,
+                        lead.chat_id,
+                        lead.name,
+                        lead.phone,
+                        lead.raw_phone,
+                        int(lead.duplicate),
+                        json.dumps(lead.answers, ensure_ascii=False),
+                    )
+                    for lead in batch
+                ],
+            )
+            self._db.execute("COMMIT")
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    async def flush(self) -> None:
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, []
+        try:
+            await self._run(self._write_batch, batch)
+        except Exception:
+            log.exception("Failed to save %d lead(s), will retry", len(batch))
+            self._pending[:0] = batch
+
+    def page(self, after_id: int = 0, limit: int = 500, since: Optional[float] = None) -> list[dict]:
+        """Up to ``limit`` leads with id above ``after_id``, oldest first."""
+        rows = self._db.execute(
+            f"SELECT {', '.join(EXPORT_FIELDS)} FROM leads WHERE id > ? AND created_at >= ? ORDER BY id LIMIT ?",
+            (after_id, since or 0, limit),
+        ).fetchall()
+        return [dict(zip(EXPORT_FIELDS, row)) for row in rows]
+
+    def _export(self, out: TextIO, fmt: str, since: Optional[float], page_size: int) -> int:
+        writer = csv.DictWriter(out, EXPORT_FIELDS) if fmt == "csv" else None
+        if writer is not None:
+            writer.writeheader()
+        else:
+            out.write("[")
+        count, after_id = 0, 0
+        while True:
+            rows = self.page(after_id, page_size, since)
+            if not rows:
+                break
+            for row in rows:
+                row["created_at"] = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(row["created_at"]))
+                row["duplicate"] = bool(row["duplicate"])
+                if writer is not None:
+                    writer.writerow(row)
+                else:
+                    row["answers"] = json.loads(row["answers"])
+                    out.write(("," if count else "") + "\n" + json.dumps(row, ensure_ascii=False))
+                count += 1
+            after_id = rows[-1]["id"]
+        if writer is None:
+            out.write("\n]\n")
+        return count
+
+    async def export(self, out: TextIO, fmt: str = "csv", since: Optional[float] = None, page_size: int = 500) -> int:
+        """Write leads to ``out`` as CSV or a JSON array, page by page; returns how many."""
+        if fmt not in ("csv", "json"):
+            raise ValueError(f"Unsupported export format {fmt!r}")
+        await self.flush()
+        return await self._run(self._export, out, fmt, since, page_size)
+
+    async def close(self) -> None:
+        if self._flusher is not None and not self._flusher.done():
+            self._flusher.cancel()
+        await self.flush()
+        await self._run(self._db.close)
+        self._executor.shutdown()
@@ -0,0 +1,117 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from typing import Iterable, Optional
+
+from aiogram import Bot, types
+from aiogram.utils.exceptions import BadRequest
+
+log = logging.getLogger(__name__)
+
+
+def source_key(source: str) -> str:
+    if os.path.isfile(source):
+        digest = hashlib.sha256()
+        with open(source, "rb") as file:
+            for chunk in iter(lambda: file.read(65536), b""):
+                digest.update(chunk)
+        return "file:" + digest.hexdigest()
+    return "url:" + hashlib.sha256(source.encode()).hexdigest()
+
+
+class MediaCache:
+    """
+    Remembers the file_id Telegram assigns to each uploaded photo.
+
+    Shard workers share the file: every change re-reads it first, so one process saving
+    does not drop the file_ids the others added since it started.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._file_ids: dict[str, str] = {}
+        self._keys: dict[str, tuple[Optional[tuple[int, int]], str]] = {}
+        self._uploads: dict[str, asyncio.Future] = {}
+        self._load()
+
+    def _load(self) -> None:
+        try:
+            with open(self.path, encoding="utf-8") as file:
+                self._file_ids = json.load(file)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError):
+            log.warning("Media cache %s is unreadable, starting empty", self.path)
+
+    def _save(self, key: str, file_id: Optional[str]) -> None:
+        self._load()
+        if file_id is None:
+            self._file_ids.pop(key, None)
+        else:
+            self._file_ids[key] = file_id
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump(self._file_ids, file)
+        os.replace(tmp_path, self.path)
+
+    def _key(self, source: str) -> str:
+        # Local files are rehashed whenever their mtime or size changes, so an edited file is uploaded again.
+        try:
+            stat = os.stat(source)
+            signature = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            signature = None
+        cached = self._keys.get(source)
+        if cached and cached[0] == signature:
+            return cached[1]
+        key = source_key(source)
+        self._keys[source] = (signature, key)
+        return key
+
+    def _remember(self, key: str, message: types.Message) -> None:
+        if message.photo:
+            self._save(key, message.photo[-1].file_id)
+
+    def _forget(self, key: str) -> None:
+        if self._file_ids.pop(key, None) is not None:
+            self._save(key, None)
+
+    async def send_photo(self, bot: Bot, chat_id: int, source: str, **kwargs) -> types.Message:
+        key = self._key(source)
+        file_id = self._file_ids.get(key)
+        if file_id:
+            try:
+                return await bot.send_photo(chat_id, file_id, **kwargs)
+            except BadRequest as error:
+                log.warning("Cached file_id for %s was rejected (%s), uploading again", source, error)
+                self._forget(key)
+
+        photo = types.InputFile(source) if os.path.isfile(source) else source
+        upload = self._uploads.get(key)
+        if upload is not None:
+            # Someone is uploading this photo right now: wait for its file_id instead of uploading twice.
+            file_id = await asyncio.shield(upload)
+            return await bot.send_photo(chat_id, file_id or photo, **kwargs)
+
+        upload = self._uploads[key] = asyncio.get_running_loop().create_future()
+        try:
+            message = await bot.send_photo(chat_id, photo, **kwargs)
+            self._remember(key, message)
+            return message
+        finally:
+            upload.set_result(self._file_ids.get(key))
+            del self._uploads[key]
+
+    async def warm(self, bot: Bot, chat_id: Optional[int], sources: Iterable[str]) -> None:
+        if not chat_id:
+            return
+        for source in sources:
+            if self._key(source) in self._file_ids:
+                continue
+            try:
+                message = await self.send_photo(bot, chat_id, source, disable_notification=True)
+                await bot.delete_message(chat_id, message.message_id)
+            except Exception:
+                log.exception("Failed to warm media cache for %s", source)
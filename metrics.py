@@ -0,0 +1,178 @@
+import logging
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from typing import Awaitable, Callable, Optional
+
+from aiogram import Bot, types
+from aiogram.dispatcher.handler import current_handler
+from aiogram.dispatcher.middlewares import BaseMiddleware
+from aiohttp import web
+
+log = logging.getLogger(__name__)
+
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    __slots__ = ("counts", "total", "count")
+
+    def __init__(self) -> None:
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def render(self, name: str, labels: str) -> list[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {self.count}')
+        lines.append(f"{name}_sum{{{labels}}} {self.total}")
+        lines.append(f"{name}_count{{{labels}}} {self.count}")
+        return lines
+
+
+def _label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Metrics:
+    def __init__(self) -> None:
+        self.handler_latency: defaultdict[str, Histogram] = defaultdict(Histogram)
+        self.api_latency: defaultdict[str, Histogram] = defaultdict(Histogram)
+        self.update_latency = Histogram()
+        self.updates: defaultdict[str, int] = defaultdict(int)
+        self.errors: defaultdict[str, int] = defaultdict(int)
+        self.api_errors: defaultdict[str, int] = defaultdict(int)
+        self.transitions: defaultdict[tuple[str, str], int] = defaultdict(int)
+        self.gauges: dict[str, Callable[[], Awaitable[dict[str, float]]]] = {}
+
+    def quiz_step(self, from_state: str, to_state: str) -> None:
+        self.transitions[from_state, to_state] += 1
+
+    def gauge(self, name: str, collect: Callable[[], Awaitable[dict[str, float]]]) -> None:
+        self.gauges[name] = collect
+
+    async def render(self) -> str:
+        lines = ["# TYPE bot_updates_total counter"]
+        lines += [f'bot_updates_total{{type="{kind}"}} {count}' for kind, count in self.updates.items()]
+        lines.append("# TYPE bot_errors_total counter")
+        lines += [f'bot_errors_total{{error="{_label(kind)}"}} {count}' for kind, count in self.errors.items()]
+        lines.append("# TYPE bot_update_duration_seconds histogram")
+        lines += self.update_latency.render("bot_update_duration_seconds", 'dispatcher="dp"')
+        lines.append("# TYPE bot_handler_duration_seconds histogram")
+        for handler, histogram in self.handler_latency.items():
+            lines += histogram.render("bot_handler_duration_seconds", f'handler="{_label(handler)}"')
+        lines.append("# TYPE bot_api_duration_seconds histogram")
+        for method, histogram in self.api_latency.items():
+            lines += histogram.render("bot_api_duration_seconds", f'method="{_label(method)}"')
+        lines.append("# TYPE bot_api_errors_total counter")
+        lines += [f'bot_api_errors_total{{method="{_label(method)}"}} {count}' for method, count in self.api_errors.items()]
+        lines.append("# TYPE bot_quiz_transitions_total counter")
+        lines += [
+            f'bot_quiz_transitions_total{{from="{_label(source)}",to="{_label(target)}"}} {count}'
+            for (source, target), count in self.transitions.items()
+        ]
+        for name, collect in self.gauges.items():
+            lines.append(f"# TYPE {name} gauge")
+            try:
+                values = await collect()
+            except Exception:
+                log.exception("Failed to collect %s", name)
+                continue
+            lines += [f'{name}{{state="{_label(state)}"}} {value}' for state, value in values.items()]
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+class MetricsMiddleware(BaseMiddleware):
+    """Times every update and every handler that runs for it."""
+
+    def __init__(self, registry: Metrics = metrics) -> None:
+        super().__init__()
+        self.registry = registry
+
+    async def on_pre_process_update(self, update: types.Update, data: dict) -> None:
+        data["metrics_started"] = time.perf_counter()
+
+    async def on_post_process_update(self, update: types.Update, results, data: dict) -> None:
+        self.registry.update_latency.observe(time.perf_counter() - data["metrics_started"])
+        kind = "message" if update.message else "callback_query" if update.callback_query else "other"
+        self.registry.updates[kind] += 1
+
+    async def on_pre_process_error(self, update: types.Update, error: Exception, data: dict) -> None:
+        self.registry.errors[type(error).__name__] += 1
+
+    async def _start_handler(self, data: dict) -> None:
+        handler = data.get("route") or current_handler.get()
+        data["metrics_handler"] = getattr(handler, "__qualname__", repr(handler))
+        data["metrics_handler_started"] = time.perf_counter()
+
+    async def _finish_handler(self, data: dict) -> None:
+        handler = data.get("metrics_handler")
+        if handler is not None:
+            self.registry.handler_latency[handler].observe(time.perf_counter() - data["metrics_handler_started"])
+
+    async def on_process_message(self, message: types.Message, data: dict) -> None:
+        await self._start_handler(data)
+
+    async def on_post_process_message(self, message: types.Message, results, data: dict) -> None:
+        await self._finish_handler(data)
+
+    async def on_process_callback_query(self, callback_query: types.CallbackQuery, data: dict) -> None:
+        await self._start_handler(data)
+
+    async def on_post_process_callback_query(self, callback_query: types.CallbackQuery, results, data: dict) -> None:
+        await self._finish_handler(data)
+
+
+class InstrumentedBot(Bot):
+    """Bot that records the latency and failures of every Bot API call."""
+
+    registry = metrics
+
+    async def request(self, method, data=None, files=None, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await super().request(method, data, files, **kwargs)
+        except Exception:
+            self.registry.api_errors[method] += 1
+            raise
+        finally:
+            self.registry.api_latency[method].observe(time.perf_counter() - started)
+
+
+async def start_server(host: str, port: int, registry: Metrics = metrics) -> web.AppRunner:
+    async def handle(request: web.Request) -> web.Response:
+        return web.Response(text=await registry.render(), content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
+
+
+async def count_states(storage, prefix: Optional[tuple[str, ...]] = None) -> dict[str, float]:
+    counts: dict[str, float] = {}
+    if hasattr(storage, "count_states"):
+        counts = await storage.count_states()
+    elif hasattr(storage, "data"):
+        # MemoryStorage keeps {chat: {user: {"state": ..., ...}}}
+        for users in storage.data.values():
+            for record in users.values():
+                if record.get("state"):
+                    counts[record["state"]] = counts.get(record["state"], 0) + 1
+    if prefix:
+        counts = {state: count for state, count in counts.items() if state.startswith(prefix)}
+    return counts
@@ -0,0 +1,147 @@
+import asyncio
+import logging
+import sqlite3
+import time
+from typing import Optional
+
+from aiogram import Bot
+from aiogram.utils.exceptions import BadRequest, RetryAfter, TelegramAPIError, Unauthorized
+
+log = logging.getLogger(__name__)
+
+MESSAGE_LIMIT = 4096
+SEPARATOR = "\n\n———\n\n"
+
+
+class Outbox:
+    """
+    Durable queue of messages for the admin chat.
+
+    ``put`` commits the message to SQLite and returns immediately; a background sender
+    delivers it no faster than one message per ``min_interval`` seconds per chat, merging
+    everything queued for the same chat into as few messages as fit the Telegram limit.
+    A batch Telegram refuses outright (``BadRequest``, ``Unauthorized``) is retried one row
+    at a time, and a row that still fails is moved to the ``outbox_dead`` table, so it
+    never blocks the messages queued behind it.
+    """
+
+    def __init__(self, path: str, min_interval: float = 1.0, max_backoff: float = 60.0, poll_interval: float = 1.0) -> None:
+        self.min_interval = min_interval
+        self.max_backoff = max_backoff
+        self.poll_interval = poll_interval
+        self._db = sqlite3.connect(path, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS outbox ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, chat_id INTEGER NOT NULL, text TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS outbox_dead ("
+            "id INTEGER PRIMARY KEY, chat_id INTEGER NOT NULL, text TEXT NOT NULL, created_at REAL NOT NULL, "
+            "failed_at REAL NOT NULL, error TEXT NOT NULL)"
+        )
+        self._wakeup = asyncio.Event()
+        self._sender: Optional[asyncio.Task] = None
+        self._last_sent: dict[int, float] = {}
+        # Rows up to this id were part of a rejected batch and are sent one at a time.
+        self._split_until = 0
+
+    def put(self, chat_id: int, text: str) -> None:
+        self._db.execute("INSERT INTO outbox (chat_id, text, created_at) VALUES (?, ?, ?)", (chat_id, text, time.time()))
+        self._wakeup.set()
+
+    def pending(self) -> int:
+        return self._db.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+    def start(self, bot: Bot) -> None:
+        if self._sender is None:
+            self._sender = asyncio.create_task(self._run(bot))
+
+    async def stop(self, timeout: float = 5.0) -> None:
+        if self._sender is None:
+            return
+        # Give queued messages a chance to go out; whatever is left is sent after the restart.
+        deadline = time.monotonic() + timeout
+        while self.pending() and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        self._sender.cancel()
+        try:
+            await self._sender
+        except asyncio.CancelledError:
+            pass
+        self._sender = None
+        self._db.close()
+
+    def _next_batch(self) -> tuple[Optional[int], list[int], str]:
+        row = self._db.execute("SELECT chat_id FROM outbox ORDER BY id LIMIT 1").fetchone()
+        if row is None:
+            return None, [], ""
+        chat_id = row[0]
+        ids, parts, size = [], [], 0
+        for message_id, text in self._db.execute(
+            "SELECT id, text FROM outbox WHERE chat_id = ? ORDER BY id LIMIT 50", (chat_id,)
+        ):
+            if ids and ids[0] <= self._split_until:
+                break
+            added = len(text) + (len(SEPARATOR) if parts else 0)
+            if parts and size + added > MESSAGE_LIMIT:
+                break
+            ids.append(message_id)
+            parts.append(text)
+            size += added
+        return chat_id, ids, SEPARATOR.join(parts)[:MESSAGE_LIMIT]
+
+    async def _run(self, bot: Bot) -> None:
+        backoff = 1.0
+        while True:
+            chat_id, ids, text = self._next_batch()
+            if chat_id is None:
+                self._wakeup.clear()
+                # Other processes (shard workers) may add rows too, so do not rely on the event alone.
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            wait = self._last_sent.get(chat_id, 0) + self.min_interval - time.monotonic()
+            if wait > 0:
+                # Let a burst accumulate so it is merged into one message.
+                await asyncio.sleep(wait)
+                continue
+
+            try:
+                await bot.send_message(chat_id, text)
+            except RetryAfter as error:
+                log.warning("Outbox throttled for chat %s, retrying in %s s", chat_id, error.timeout)
+                await asyncio.sleep(error.timeout)
+                continue
+            except (BadRequest, Unauthorized) as error:
+                self._reject(chat_id, ids, error)
+                continue
+            except (TelegramAPIError, OSError, asyncio.TimeoutError):
+                log.exception("Outbox failed to deliver %d message(s) to %s, retrying in %.0f s", len(ids), chat_id, backoff)
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+                continue
+
+            backoff = 1.0
+            self._last_sent[chat_id] = time.monotonic()
+            self._db.executemany("DELETE FROM outbox WHERE id = ?", [(message_id,) for message_id in ids])
+
+    def _reject(self, chat_id: int, ids: list[int], error: TelegramAPIError) -> None:
+        if len(ids) > 1:
+            # One of the merged messages may be the bad one: send them separately.
+            log.warning("Outbox batch of %d message(s) to %s rejected (%s), sending one by one", len(ids), chat_id, error)
+            self._split_until = max(self._split_until, ids[-1])
+            return
+        log.error("Outbox gave up on message #%d to %s: %s", ids[0], chat_id, error)
+        self._db.execute("BEGIN")
+        self._db.execute(
+            "INSERT INTO outbox_dead (id, chat_id, text, created_at, failed_at, error) "
+            "SELECT id, chat_id, text, created_at, ?, ? FROM outbox WHERE id = ?",
+            (time.time(), str(error), ids[0]),
+        )
+        self._db.execute("DELETE FROM outbox WHERE id = ?", (ids[0],))
+        self._db.execute("COMMIT")
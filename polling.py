@@ -0,0 +1,123 @@
+import asyncio
+import logging
+import signal
+from typing import Awaitable, Callable, Optional
+
+from aiogram import Bot, Dispatcher, types
+from aiogram.utils.exceptions import CantGetUpdates
+
+from updates import ChatSerializer, Checkpoint, UpdateJournal
+
+log = logging.getLogger(__name__)
+
+Callback = Optional[Callable[[Dispatcher], Awaitable[None]]]
+
+
+def stop_event() -> asyncio.Event:
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stopping.set)
+    return stopping
+
+
+async def ensure_no_webhook(bot: Bot) -> None:
+    # Polling and a webhook exclude each other: never take updates away from a running webhook.
+    info = await bot.get_webhook_info()
+    if info.url:
+        raise RuntimeError(
+            f"A webhook is set to {info.url}, so the bot is running in webhook mode elsewhere. Stop that "
+            "process (it deletes the webhook on shutdown) or call deleteWebhook, then start polling again."
+        )
+
+
+async def poll_updates(
+    bot: Bot,
+    journal: UpdateJournal,
+    stopping: asyncio.Event,
+    handle: Callable[[dict], Awaitable],
+    timeout: int = 20,
+) -> None:
+    """Replay journaled updates, then long-poll from the saved offset until ``stopping`` is set."""
+    backlog = journal.pending()
+    if backlog:
+        log.info("Replaying %d update(s) left from the previous run", len(backlog))
+    for update in backlog:
+        await handle(update)
+
+    offset = journal.offset()
+    while not stopping.is_set():
+        poll = asyncio.create_task(bot.get_updates(offset=offset, timeout=timeout))
+        stop = asyncio.create_task(stopping.wait())
+        await asyncio.wait({poll, stop}, return_when=asyncio.FIRST_COMPLETED)
+        stop.cancel()
+        if not poll.done():
+            poll.cancel()
+            break
+        try:
+            batch = [update.to_python() for update in poll.result()]
+        except CantGetUpdates:
+            raise RuntimeError("A webhook was set while polling: the bot was started in webhook mode elsewhere") from None
+        except Exception:
+            log.exception("getUpdates failed")
+            await asyncio.sleep(1)
+            continue
+        if not batch:
+            continue
+        journal.add(batch)
+        offset = batch[-1]["update_id"] + 1
+        for update in batch:
+            await handle(update)
+
+
+async def close_dispatcher(dp: Dispatcher) -> None:
+    await dp.storage.close()
+    await dp.storage.wait_closed()
+    session = await dp.bot.get_session()
+    await session.close()
+
+
+def run_polling(
+    dp: Dispatcher,
+    journal_path: str,
+    drain_timeout: float,
+    on_startup: Callback = None,
+    on_shutdown: Callback = None,
+    flush: Callback = None,
+) -> None:
+    """``flush`` writes out the stores handlers write behind to; updates are only marked done after it."""
+    asyncio.run(_run_polling(dp, journal_path, drain_timeout, on_startup, on_shutdown, flush))
+
+
+async def _run_polling(dp, journal_path, drain_timeout, on_startup, on_shutdown, flush) -> None:
+    journal = UpdateJournal(journal_path)
+    checkpoint = Checkpoint((lambda: flush(dp)) if flush is not None else None, journal.done)
+    stopping = stop_event()
+    Bot.set_current(dp.bot)
+    Dispatcher.set_current(dp)
+
+    async def process(update: dict) -> None:
+        # A handler that fails is not retried; one cut off by shutdown stays in the journal.
+        try:
+            await dp.updates_handler.notify(types.Update(**update))
+        finally:
+            checkpoint.done(update["update_id"])
+
+    serializer = ChatSerializer(process)
+    me = await dp.bot.me
+    log.info("Bot: %s [@%s]", me.full_name, me.username)
+    await ensure_no_webhook(dp.bot)
+    if on_startup is not None:
+        await on_startup(dp)
+
+    try:
+        await poll_updates(dp.bot, journal, stopping, serializer.submit)
+    finally:
+        log.info("Stopped polling, waiting up to %s s for %d update(s)", drain_timeout, len(serializer))
+        if not await serializer.join(drain_timeout):
+            log.warning("%d update(s) did not finish and will be replayed on the next start", len(serializer))
+        await checkpoint.close()
+        if on_shutdown is not None:
+            await on_shutdown(dp)
+        await close_dispatcher(dp)
+        journal.close()
@@ -0,0 +1,155 @@
+import json
+from dataclasses import dataclass, replace
+from typing import Callable, Optional
+
+from aiogram import Bot, Dispatcher, types
+from aiogram.dispatcher import FSMContext
+from aiogram.types import CallbackQuery, ContentType, ReplyKeyboardMarkup
+from aiogram.utils.markdown import quote_html
+
+from webhook import reply
+
+
+@dataclass(frozen=True)
+class Prompt:
+    state: str
+    text: str
+    reply_markup: str
+
+
+@dataclass(frozen=True)
+class Transition:
+    key: str
+    prompt: Prompt
+
+
+class _Answers(dict):
+    def __missing__(self, key: str) -> str:
+        return "None"
+
+
+def message_phone(message: types.Message) -> str:
+    if not message.contact:
+        return message.text.strip()
+    # Telegram sends shared contacts in international format, mostly without the plus.
+    phone = message.contact.phone_number
+    return phone if phone.startswith("+") else "+" + phone
+
+
+def options_markup(options: list[str]) -> str:
+    keyboard = ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True)
+    for option in options:
+        keyboard.add(option)
+    return keyboard.as_json()
+
+
+class QuizEngine:
+    """
+    Runs quizzes described in a JSON definition.
+
+    Every quiz is a list of steps (state key, question, options) followed by a phone step.
+    When it is done ``on_complete`` gets the last message, the quiz name and the answers.
+    At startup the steps are compiled into a transition table keyed by FSM state, with each
+    reply keyboard serialized once, so answering a step is a dict lookup and a single send.
+    The phone and done keyboards come in already serialized and can be replaced live.
+    """
+
+    def __init__(
+        self,
+        definitions: list[dict],
+        phone_markup: str,
+        done_markup: str,
+        done_text: str,
+        on_complete: Callable[[types.Message, str, dict], None],
+        on_step: Optional[Callable[[str, str], None]] = None,
+    ) -> None:
+        self.done_text = done_text
+        self.done_markup = done_markup
+        self.on_complete = on_complete
+        self.on_step = on_step
+        self.names: list[str] = []
+        self.starts: dict[str, Prompt] = {}
+        self.prompts: dict[str, Prompt] = {}
+        self.transitions: dict[str, Transition] = {}
+        self.summaries: dict[str, str] = {}
+
+        for quiz in definitions:
+            name, steps = quiz["name"], quiz["steps"]
+            self.names.append(name)
+            phone_state = f"{name}:phone"
+            prompts = [
+                Prompt(f"{name}:{step['key']}", step["question"], options_markup(step["options"]))
+                for step in steps
+            ]
+            prompts.append(Prompt(phone_state, quiz["phone_question"], phone_markup))
+            self.starts[quiz["start_callback"]] = prompts[0]
+            self.prompts.update((prompt.state, prompt) for prompt in prompts)
+            for step, next_prompt in zip(steps, prompts[1:]):
+                self.transitions[f"{name}:{step['key']}"] = Transition(step["key"], next_prompt)
+            self.summaries[phone_state] = quiz["summary"]
+
+    def set_markups(self, phone_markup: str, done_markup: str, done_text: str) -> None:
+        # Prompts are immutable: build new tables and swap each one in with a single assignment.
+        prompts = {
+            state: replace(prompt, reply_markup=phone_markup) if state in self.summaries else prompt
+            for state, prompt in self.prompts.items()
+        }
+        self.transitions = {
+            state: replace(transition, prompt=prompts[transition.prompt.state])
+            for state, transition in self.transitions.items()
+        }
+        self.starts = {callback: prompts[prompt.state] for callback, prompt in self.starts.items()}
+        self.prompts = prompts
+        self.done_markup = done_markup
+        self.done_text = done_text
+
+    @classmethod
+    def load(cls, path: str, **kwargs) -> "QuizEngine":
+        with open(path, encoding="utf-8") as file:
+            return cls(json.load(file), **kwargs)
+
+    async def start(self, callback_query: CallbackQuery, state: FSMContext):
+        prompt = self.starts[callback_query.data]
+        await callback_query.answer()
+        await state.set_state(prompt.state)
+        self._step("start", prompt.state)
+        return await reply(callback_query.message, prompt.text, reply_markup=prompt.reply_markup)
+
+    async def answer(self, message: types.Message, state: FSMContext, raw_state: str):
+        transition = self.transitions[raw_state]
+        await state.update_data({transition.key: message.text})
+        await state.set_state(transition.prompt.state)
+        self._step(raw_state, transition.prompt.state)
+        return await reply(message, transition.prompt.text, reply_markup=transition.prompt.reply_markup)
+
+    async def finish(self, message: types.Message, state: FSMContext, raw_state: str):
+        answers = await state.get_data()
+        answers["phone"] = message_phone(message)
+        self.on_complete(message, raw_state.split(":")[0], answers)
+        await state.finish()
+        self._step(raw_state, "done")
+        return await reply(message, self.done_text, reply_markup=self.done_markup)
+
+    async def remind(self, bot: Bot, chat_id: int, state: str, text: str) -> None:
+        # Repeat the unanswered question so the user can carry on with one tap.
+        prompt = self.prompts[state]
+        await bot.send_message(chat_id, f"{text}\n\n{prompt.text}", reply_markup=prompt.reply_markup)
+
+    def summary(self, name: str, answers: dict) -> str:
+        # Answers are free text and the summary goes out as HTML.
+        answers = {key: quote_html(str(value)) for key, value in answers.items()}
+        return self.summaries[f"{name}:phone"].format_map(_Answers(answers))
+
+    def partial_summary(self, state: str, data: dict) -> str:
+        return self.summary(state.split(":")[0], {"phone": "не указан", **data})
+
+    def _step(self, from_state: str, to_state: str) -> None:
+        if self.on_step is not None:
+            self.on_step(from_state, to_state)
+
+    def register(self, dp: Dispatcher) -> None:
+        dp.register_callback_query_handler(self.start, text=list(self.starts))
+        dp.register_message_handler(self.answer, state=list(self.transitions), content_types=ContentType.TEXT)
+        dp.register_message_handler(
+            self.finish, state=list(self.summaries), content_types=[ContentType.CONTACT, ContentType.TEXT]
+        )
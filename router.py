@@ -0,0 +1,60 @@
+from typing import Awaitable, Callable, Mapping, Union
+
+from aiogram import Dispatcher, types
+
+Handler = Callable[[types.Message], Awaitable]
+
+
+class TextRouter:
+    """
+    Routes reply-keyboard button presses with a single dict lookup.
+
+    aiogram checks message handlers one by one, so a handler per button costs a filter call
+    for every button on every update. The router registers one handler whose filter looks the
+    text up and passes the matching function on as ``route``.
+
+    Handlers are attached to button ids and ``set_buttons`` maps the current labels to them,
+    so the labels can be changed at runtime by swapping one dict.
+    """
+
+    def __init__(self, buttons: Mapping[str, str]) -> None:
+        # button id -> label
+        self.buttons = dict(buttons)
+        self._handlers: dict[str, Handler] = {}
+        self._routes: dict[str, Handler] = {}
+
+    def route(self, button_id: str) -> Callable[[Handler], Handler]:
+        if button_id not in self.buttons:
+            raise ValueError(f"{button_id!r} is not a menu button")
+
+        def decorator(handler: Handler) -> Handler:
+            self._handlers[button_id] = handler
+            return handler
+
+        return decorator
+
+    def check(self, buttons: Mapping[str, str]) -> None:
+        missing = [button_id for button_id in buttons if button_id not in self._handlers]
+        if missing:
+            raise ValueError(f"Menu buttons without a handler: {missing}")
+
+    def set_buttons(self, buttons: Mapping[str, str]) -> None:
+        self.check(buttons)
+        self.buttons = dict(buttons)
+        self._routes = {text: self._handlers[button_id] for button_id, text in buttons.items()}
+
+    def match(self, message: types.Message) -> Union[dict, bool]:
+        handler = self._routes.get(message.text)
+        if handler is None:
+            return False
+        return {"route": handler}
+
+    async def dispatch(self, message: types.Message, route: Handler):
+        return await route(message)
+
+    def register(self, dp: Dispatcher, **kwargs) -> None:
+        try:
+            self.set_buttons(self.buttons)
+        except ValueError as error:
+            raise RuntimeError(str(error)) from None
+        dp.register_message_handler(self.dispatch, self.match, content_types=types.ContentType.TEXT, **kwargs)
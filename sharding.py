@@ -0,0 +1,285 @@
+import asyncio
+import importlib
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import sys
+import time
+from typing import Optional
+
+from aiogram import Bot, Dispatcher, types
+
+from polling import Callback, close_dispatcher, ensure_no_webhook, poll_updates, stop_event
+from updates import ChatSerializer, Checkpoint, UpdateJournal, chat_id_of
+
+log = logging.getLogger(__name__)
+
+STOP = None
+# Time a shard gets after its drain to flush its stores and run its shutdown hook.
+SHUTDOWN_GRACE = 3.0
+# How often blocked queue operations look up from the queue to check for shutdown.
+POLL_INTERVAL = 0.2
+# How often the front end checks that every shard process is still running.
+SUPERVISE_INTERVAL = 1.0
+
+
+def shard_of(chat_id: int, workers: int) -> int:
+    return chat_id % workers
+
+
+def load_module(name: str):
+    # Under the spawn start method the parent's main script is re-run in the child as
+    # __mp_main__; reuse it when it is the bot module so handlers are not registered twice.
+    main = sys.modules.get("__mp_main__")
+    main_file = getattr(main, "__file__", None) or ""
+    if os.path.splitext(os.path.basename(main_file))[0] == name:
+        return main
+    return importlib.import_module(name)
+
+
+def _should_stop(stopping) -> bool:
+    # Also stop with the front end if it was killed before it could signal the shards.
+    parent = multiprocessing.parent_process()
+    return stopping.is_set() or (parent is not None and not parent.is_alive())
+
+
+def _next_update(updates: multiprocessing.Queue, stopping) -> Optional[dict]:
+    while not _should_stop(stopping):
+        try:
+            return updates.get(timeout=POLL_INTERVAL)
+        except queue.Empty:
+            pass
+    return STOP
+
+
+def worker_main(
+    module_name: str,
+    shard: int,
+    workers: int,
+    updates: multiprocessing.Queue,
+    done: multiprocessing.Queue,
+    ready,
+    hooks: tuple[Optional[str], Optional[str], Optional[str]] = (None, None, None),
+    stopping=None,
+    deadline=None,
+) -> None:
+    # Shutdown is driven by the front end: it sets ``stopping`` and the shared wall-clock ``deadline``.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_worker(load_module(module_name), shard, workers, updates, done, ready, hooks, stopping, deadline))
+
+
+async def _worker(module, shard: int, workers: int, updates, done, ready, hooks, stopping, deadline) -> None:
+    dp: Dispatcher = module.dp
+    Bot.set_current(dp.bot)
+    Dispatcher.set_current(dp)
+    loop = asyncio.get_running_loop()
+    # Hooks are looked up by name: functions of a __main__ module cannot be pickled for spawn.
+    on_startup, on_shutdown, flush = (getattr(module, name) if name else None for name in hooks)
+    if on_startup is not None:
+        await on_startup(dp, shard, workers)
+    checkpoint = Checkpoint((lambda: flush(dp)) if flush is not None else None, done.put)
+
+    async def process(update: dict) -> None:
+        try:
+            await dp.updates_handler.notify(types.Update(**update))
+        finally:
+            checkpoint.done(update["update_id"])
+
+    serializer = ChatSerializer(process)
+    ready.set()
+    log.info("Shard %d started (pid %d)", shard, os.getpid())
+
+    async def feed() -> None:
+        while True:
+            update = await loop.run_in_executor(None, _next_update, updates, stopping)
+            if update is STOP:
+                return
+            await serializer.submit(update)
+
+    # The feeder may be stuck in submit behind a full serializer, so watch for shutdown separately.
+    feeder = asyncio.create_task(feed())
+    while not _should_stop(stopping) and not feeder.done():
+        await asyncio.sleep(POLL_INTERVAL)
+    feeder.cancel()
+    # Updates still queued were never started; they stay in the journal and are replayed.
+    remaining = deadline.value - time.time() if stopping.is_set() else 0
+    if not await serializer.join(max(remaining, 0)):
+        log.warning("Shard %d: %d update(s) did not finish and will be replayed on the next start", shard, len(serializer))
+    await checkpoint.close()
+    if on_shutdown is not None:
+        await on_shutdown(dp)
+    await close_dispatcher(dp)
+    log.info("Shard %d stopped", shard)
+
+
+class ShardedRunner:
+    """
+    Fans updates out to worker processes by chat_id.
+
+    Each worker owns a bounded queue; when a shard falls behind, ``dispatch`` blocks until it
+    catches up, so the front end stops pulling new updates instead of buffering them.
+    Workers report the ids of finished updates on a shared ``done`` queue, in batches, after
+    running ``worker_flush``. ``worker_startup``, ``worker_shutdown`` and ``worker_flush`` name
+    coroutine functions of the bot module, called as ``(dp, shard, workers)``, ``(dp)`` and ``(dp)``.
+    On ``stop`` the shards stop taking updates and get until one shared deadline,
+    ``drain_timeout`` from now, to finish the running ones; then they flush and shut down.
+    Updates still queued are left in the journal and replayed on the next start.
+    A shard that exits on its own is not restarted: ``check_shards`` raises and the front end
+    fails, leaving the restart (and the replay of the shard's updates) to the process manager.
+    """
+
+    def __init__(
+        self,
+        module_name: str,
+        workers: int,
+        queue_size: int = 1000,
+        worker_startup: Optional[str] = None,
+        worker_shutdown: Optional[str] = None,
+        worker_flush: Optional[str] = None,
+        drain_timeout: float = 20,
+    ) -> None:
+        self.module_name = module_name
+        self.workers = workers
+        self.queue_size = queue_size
+        self.drain_timeout = drain_timeout
+        self.hooks = (worker_startup, worker_shutdown, worker_flush)
+        self._context = multiprocessing.get_context("spawn")
+        self._queues: list[multiprocessing.Queue] = []
+        self._processes: list[multiprocessing.Process] = []
+        self.done = self._context.Queue()
+        self.stopping = self._context.Event()
+        self.deadline = self._context.Value("d", 0.0)
+
+    def start(self, timeout: float = 60) -> None:
+        ready_events = []
+        for shard in range(self.workers):
+            updates = self._context.Queue(self.queue_size)
+            ready = self._context.Event()
+            process = self._context.Process(
+                target=worker_main,
+                args=(
+                    self.module_name, shard, self.workers, updates, self.done, ready, self.hooks, self.stopping, self.deadline
+                ),
+                name=f"shard-{shard}",
+                daemon=True,
+            )
+            process.start()
+            self._queues.append(updates)
+            self._processes.append(process)
+            ready_events.append(ready)
+        for shard, ready in enumerate(ready_events):
+            if not ready.wait(timeout):
+                raise RuntimeError(f"Shard {shard} did not start in {timeout} s")
+
+    def check_shards(self) -> None:
+        for process in self._processes:
+            if not process.is_alive():
+                log.error("%s (pid %s) exited with code %s", process.name, process.pid, process.exitcode)
+                raise RuntimeError(f"{process.name} exited with code {process.exitcode}; its updates stay in the journal")
+
+    async def dispatch(self, update: dict, stopping: Optional[asyncio.Event] = None) -> None:
+        shard = shard_of(chat_id_of(update), self.workers)
+        updates = self._queues[shard]
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                updates.put_nowait(update)
+                return
+            except queue.Full:
+                pass
+            if stopping is not None and stopping.is_set():
+                return  # the update is journaled and replayed on the next start
+            try:
+                await loop.run_in_executor(None, updates.put, update, True, POLL_INTERVAL)
+                return
+            except queue.Full:
+                # A dead shard never drains its queue; do not wait for it forever.
+                self.check_shards()
+
+    async def stop(self) -> None:
+        loop = asyncio.get_running_loop()
+        self.deadline.value = time.time() + self.drain_timeout
+        self.stopping.set()
+        for updates in self._queues:
+            # Nobody may read what is left; do not wait at exit to push it into the pipe.
+            updates.cancel_join_thread()
+        for process in self._processes:
+            await loop.run_in_executor(None, process.join, max(self.deadline.value + SHUTDOWN_GRACE - time.time(), 0))
+            if process.is_alive():
+                # Only a hung shutdown hook gets here: the shard already stopped waiting for its handlers.
+                log.warning("%s did not stop in time, terminating", process.name)
+                process.terminate()
+        self._queues.clear()
+        self._processes.clear()
+
+
+def run_sharded(
+    dp: Dispatcher,
+    module_name: str,
+    workers: int,
+    queue_size: int,
+    journal_path: str,
+    drain_timeout: float,
+    on_startup: Callback = None,
+    on_shutdown: Callback = None,
+    worker_startup: Optional[str] = None,
+    worker_shutdown: Optional[str] = None,
+    worker_flush: Optional[str] = None,
+) -> None:
+    runner = ShardedRunner(module_name, workers, queue_size, worker_startup, worker_shutdown, worker_flush, drain_timeout)
+    asyncio.run(_front_end(dp, runner, journal_path, on_startup, on_shutdown))
+
+
+async def _collect_done(runner: ShardedRunner, journal: UpdateJournal) -> None:
+    loop = asyncio.get_running_loop()
+    while True:
+        update_ids = await loop.run_in_executor(None, runner.done.get)
+        if update_ids is STOP:
+            return
+        journal.done(update_ids)
+
+
+async def _supervise(runner: ShardedRunner, stopping: asyncio.Event) -> None:
+    # A shard that dies while its queue is not full would otherwise go unnoticed until it is.
+    while not stopping.is_set():
+        runner.check_shards()
+        await asyncio.sleep(SUPERVISE_INTERVAL)
+
+
+async def _front_end(dp, runner: ShardedRunner, journal_path, on_startup, on_shutdown) -> None:
+    journal = UpdateJournal(journal_path)
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, runner.start)
+    log.info("Started %d shard workers", runner.workers)
+    collector = asyncio.create_task(_collect_done(runner, journal))
+
+    stopping = stop_event()
+    Bot.set_current(dp.bot)
+    try:
+        # Inside the try: if startup fails the shards and the collector thread must still be stopped.
+        await ensure_no_webhook(dp.bot)
+        if on_startup is not None:
+            await on_startup(dp)
+        polling = asyncio.create_task(
+            poll_updates(dp.bot, journal, stopping, lambda update: runner.dispatch(update, stopping))
+        )
+        supervisor = asyncio.create_task(_supervise(runner, stopping))
+        try:
+            finished, _ = await asyncio.wait({polling, supervisor}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            polling.cancel()
+            supervisor.cancel()
+        for task in finished:
+            task.result()
+    finally:
+        await runner.stop()
+        runner.done.put(STOP)
+        await collector
+        if on_shutdown is not None:
+            await on_shutdown(dp)
+        await close_dispatcher(dp)
+        journal.close()
@@ -0,0 +1,141 @@
+import logging
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from aiogram import types
+from aiogram.dispatcher.handler import CancelHandler, current_handler
+from aiogram.dispatcher.middlewares import BaseMiddleware
+
+log = logging.getLogger(__name__)
+
+Limit = tuple[int, float]
+
+WARNING_TEXT = "⏳ Слишком много запросов. Пожалуйста, подождите немного."
+
+
+class _Window:
+    __slots__ = ("start", "previous", "current", "warned")
+
+    def __init__(self, now: float) -> None:
+        self.start = now
+        self.previous = 0
+        self.current = 0
+        self.warned = False
+
+    def allow(self, limit: int, period: float, now: float) -> bool:
+        elapsed = now - self.start
+        if elapsed >= period:
+            self.previous = self.current if elapsed < 2 * period else 0
+            self.current = 0
+            self.warned = False
+            self.start += period * (elapsed // period)
+            elapsed = now - self.start
+        # Assume the previous window's hits were spread evenly and count the part still inside.
+        if self.previous * (1 - elapsed / period) + self.current >= limit:
+            return False
+        self.current += 1
+        return True
+
+
+class _Chat:
+    __slots__ = ("seen", "text", "text_at", "windows")
+
+    def __init__(self) -> None:
+        self.seen = 0.0
+        self.text: Optional[int] = None
+        self.text_at = 0.0
+        self.windows: dict[str, _Window] = {}
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """
+    Per-chat anti-flood limits for messages and callback queries.
+
+    Every (chat, handler) pair gets a sliding-window counter: the current and the previous
+    fixed window, with the previous one weighted by how much of it still overlaps. That is
+    three numbers per pair instead of a timestamp per message. ``limits`` maps handler names
+    to ``(count, period)``; other handlers share ``default``. A message repeating the chat's
+    previous text within ``duplicate_window`` seconds is dropped before any filter runs,
+    unless the user is in a dialog state: there a repeated answer is a real answer.
+    Chats are kept in least-recently-seen order, so idle ones are evicted from the front.
+    """
+
+    def __init__(
+        self,
+        limits: Optional[dict[str, Limit]] = None,
+        default: Limit = (10, 10.0),
+        duplicate_window: float = 3.0,
+        warning: str = WARNING_TEXT,
+    ) -> None:
+        super().__init__()
+        self.limits = limits or {}
+        self.default = default
+        self.duplicate_window = duplicate_window
+        self.warning = warning
+        self.idle_after = max([period for _count, period in self.limits.values()] + [default[1], duplicate_window])
+        self._chats: OrderedDict[int, _Chat] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._chats)
+
+    def _chat(self, chat_id: int, now: float) -> _Chat:
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            chat = self._chats[chat_id] = _Chat()
+        else:
+            self._chats.move_to_end(chat_id)
+        chat.seen = now
+        while True:
+            oldest_id, oldest = next(iter(self._chats.items()))
+            if now - oldest.seen <= self.idle_after:
+                break
+            del self._chats[oldest_id]
+        return chat
+
+    def _allow(self, chat_id: int, data: dict) -> tuple[bool, bool]:
+        """Whether the handler may run and, if not, whether this is the first refusal in its window."""
+        handler = data.get("route") or current_handler.get()
+        name = getattr(handler, "__qualname__", repr(handler))
+        count, period = self.limits.get(name, self.default)
+        now = time.monotonic()
+        chat = self._chat(chat_id, now)
+        window = chat.windows.get(name)
+        if window is None:
+            window = chat.windows[name] = _Window(now)
+        if window.allow(count, period, now):
+            return True, False
+        first, window.warned = not window.warned, True
+        if first:
+            log.info("Throttling chat %s on %s", chat_id, name)
+        return False, first
+
+    async def on_pre_process_message(self, message: types.Message, data: dict) -> None:
+        if not message.text:
+            return
+        now = time.monotonic()
+        chat = self._chat(message.chat.id, now)
+        text = hash(message.text)
+        if chat.text == text and now - chat.text_at < self.duplicate_window:
+            # Only read the state for an actual repeat: most messages never touch the storage here.
+            state = await self.manager.dispatcher.storage.get_state(chat=message.chat.id, user=message.from_user.id)
+            if state is None:
+                raise CancelHandler()
+        chat.text, chat.text_at = text, now
+
+    async def on_process_message(self, message: types.Message, data: dict) -> None:
+        allowed, warn = self._allow(message.chat.id, data)
+        if allowed:
+            return
+        if warn:
+            await message.answer(self.warning)
+        raise CancelHandler()
+
+    async def on_process_callback_query(self, callback_query: types.CallbackQuery, data: dict) -> None:
+        chat_id = callback_query.message.chat.id if callback_query.message else callback_query.from_user.id
+        allowed, warn = self._allow(chat_id, data)
+        if allowed:
+            return
+        # The button spinner has to be stopped either way.
+        await callback_query.answer(self.warning if warn else None)
+        raise CancelHandler()
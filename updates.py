@@ -0,0 +1,166 @@
+import asyncio
+import json
+import logging
+import sqlite3
+from typing import Awaitable, Callable, Optional
+
+log = logging.getLogger(__name__)
+
+
+def chat_id_of(update: dict) -> int:
+    """Chat an update belongs to (the sender for updates without a chat), 0 if none."""
+    for key, value in update.items():
+        if key == "update_id" or not isinstance(value, dict):
+            continue
+        message = value.get("message") if key == "callback_query" else value
+        if isinstance(message, dict) and "chat" in message:
+            return message["chat"]["id"]
+        if "from" in value:
+            return value["from"]["id"]
+        if "user" in value:
+            return value["user"]["id"]
+    return 0
+
+
+class ChatSerializer:
+    """
+    Processes updates concurrently across chats but strictly in order within a chat.
+
+    ``submit`` waits while ``max_pending`` updates are queued or running, which pushes
+    back on whoever is feeding updates in.
+    """
+
+    def __init__(self, process: Callable[[dict], Awaitable], concurrency: int = 100, max_pending: int = 1000) -> None:
+        self.process = process
+        self._concurrency = asyncio.Semaphore(concurrency)
+        self._capacity = asyncio.Semaphore(max_pending)
+        self._tails: dict[int, asyncio.Task] = {}
+        self._tasks: set[asyncio.Task] = set()
+
+    def __len__(self) -> int:
+        return len(self._tasks)
+
+    async def submit(self, update: dict) -> asyncio.Task:
+        await self._capacity.acquire()
+        chat_id = chat_id_of(update)
+        task = asyncio.create_task(self._run(self._tails.get(chat_id), update))
+        self._tails[chat_id] = task
+        self._tasks.add(task)
+        task.add_done_callback(lambda done: self._done(chat_id, done))
+        return task
+
+    def _done(self, chat_id: int, task: asyncio.Task) -> None:
+        self._tasks.discard(task)
+        if self._tails.get(chat_id) is task:
+            del self._tails[chat_id]
+        self._capacity.release()
+
+    async def _run(self, previous: Optional[asyncio.Task], update: dict) -> None:
+        if previous is not None:
+            await asyncio.wait([previous])
+        async with self._concurrency:
+            try:
+                await self.process(update)
+            except Exception:
+                log.exception("Failed to process update %s", update.get("update_id"))
+
+    async def join(self, timeout: Optional[float] = None) -> bool:
+        """Wait for queued updates; returns False if some were still running after ``timeout``."""
+        if not self._tasks:
+            return True
+        _done, pending = await asyncio.wait(set(self._tasks), timeout=timeout)
+        return not pending
+
+
+class Checkpoint:
+    """
+    Reports finished updates only once everything their handlers wrote is on disk.
+
+    Stores such as the FSM and the lead database write behind, so an update whose handler
+    returned may still exist only in memory. ``done`` collects update ids; at most every
+    ``interval`` seconds ``flush`` runs and then ``commit`` gets the ids finished before it.
+    """
+
+    def __init__(
+        self,
+        flush: Optional[Callable[[], Awaitable]],
+        commit: Callable[[list[int]], None],
+        interval: float = 0.5,
+    ) -> None:
+        self.flush = flush
+        self.commit = commit
+        self.interval = interval
+        self._ids: list[int] = []
+        self._timer: Optional[asyncio.Task] = None
+
+    def done(self, update_id: int) -> None:
+        self._ids.append(update_id)
+        if self._timer is None or self._timer.done():
+            self._timer = asyncio.create_task(self._later())
+
+    async def _later(self) -> None:
+        await asyncio.sleep(self.interval)
+        await self.run()
+
+    async def run(self) -> None:
+        if not self._ids:
+            return
+        ids, self._ids = self._ids, []
+        try:
+            if self.flush is not None:
+                await self.flush()
+        except Exception:
+            log.exception("Failed to flush stores, %d update(s) stay in the journal", len(ids))
+            self._ids[:0] = ids
+            return
+        self.commit(ids)
+
+    async def close(self) -> None:
+        if self._timer is not None and not self._timer.done():
+            self._timer.cancel()
+        await self.run()
+
+
+class UpdateJournal:
+    """
+    Updates fetched from Telegram but not yet fully processed, plus the next offset to poll.
+
+    Telegram forgets an update as soon as a later offset is requested, so every batch is
+    written here before it is handed to the dispatcher and removed once its handlers finish
+    and the stores they wrote to are flushed (see ``Checkpoint``).
+    Whatever is left after a crash or an unfinished drain is replayed on the next start.
+    """
+
+    def __init__(self, path: str) -> None:
+        self._db = sqlite3.connect(path, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS pending (update_id INTEGER PRIMARY KEY, payload TEXT NOT NULL)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+
+    def offset(self) -> Optional[int]:
+        row = self._db.execute("SELECT value FROM meta WHERE key = 'offset'").fetchone()
+        return row[0] if row else None
+
+    def pending(self) -> list[dict]:
+        return [json.loads(payload) for (payload,) in self._db.execute("SELECT payload FROM pending ORDER BY update_id")]
+
+    def add(self, updates: list[dict]) -> None:
+        if not updates:
+            return
+        self._db.execute("BEGIN")
+        self._db.executemany(
+            "INSERT OR IGNORE INTO pending (update_id, payload) VALUES (?, ?)",
+            [(update["update_id"], json.dumps(update, ensure_ascii=False)) for update in updates],
+        )
+        self._db.execute(
+            "INSERT INTO meta (key, value) VALUES ('offset', ?) ON CONFLICT (key) DO UPDATE SET value = excluded.value",
+            (updates[-1]["update_id"] + 1,),
+        )
+        self._db.execute("COMMIT")
+
+    def done(self, update_ids: list[int]) -> None:
+        self._db.executemany("DELETE FROM pending WHERE update_id = ?", [(update_id,) for update_id in update_ids])
+
+    def close(self) -> None:
+        self._db.close()
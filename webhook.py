@@ -0,0 +1,91 @@
+import asyncio
+import hmac
+import logging
+import secrets
+from contextvars import ContextVar
+from typing import Awaitable, Callable, Optional
+
+from aiogram import Dispatcher, types
+from aiogram.dispatcher.webhook import SendMessage, WebhookRequestHandler
+from aiogram.utils.executor import Executor
+from aiohttp import web
+
+log = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+SECRET_KEY = "WEBHOOK_SECRET"
+SEMAPHORE_KEY = "WEBHOOK_SEMAPHORE"
+
+# Set only while an update is being processed inside a webhook request,
+# so a handler can hand its reply back in the HTTP response body.
+inline_replies: ContextVar[bool] = ContextVar("inline_replies", default=False)
+
+
+async def reply(message: types.Message, text: str, **kwargs) -> Optional[SendMessage]:
+    if inline_replies.get():
+        return SendMessage(message.chat.id, text, **kwargs)
+    await message.answer(text, **kwargs)
+    return None
+
+
+class SecureWebhookRequestHandler(WebhookRequestHandler):
+    def validate_secret(self) -> None:
+        # Fail closed: without a secret anyone who finds the URL could post forged updates.
+        secret = self.request.app.get(SECRET_KEY)
+        received = self.request.headers.get(SECRET_HEADER, "")
+        if not secret or not hmac.compare_digest(received, secret):
+            log.warning("Rejected webhook request with a wrong secret token")
+            raise web.HTTPUnauthorized()
+
+    async def post(self):
+        self.validate_secret()
+        return await super().post()
+
+    async def process_update(self, update):
+        semaphore: asyncio.Semaphore = self.request.app[SEMAPHORE_KEY]
+        async with semaphore:
+            token = inline_replies.set(True)
+            try:
+                return await super().process_update(update)
+            finally:
+                inline_replies.reset(token)
+
+
+def configure_app(app: web.Application, secret: str, concurrency: int) -> None:
+    app[SECRET_KEY] = secret
+    app[SEMAPHORE_KEY] = asyncio.Semaphore(concurrency)
+
+
+def start_webhook(
+    dispatcher: Dispatcher,
+    url: str,
+    path: str,
+    secret: Optional[str],
+    concurrency: int,
+    host: str,
+    port: int,
+    on_startup: Optional[Callable[[Dispatcher], Awaitable[None]]] = None,
+    on_shutdown: Optional[Callable[[Dispatcher], Awaitable[None]]] = None,
+) -> None:
+    if not secret:
+        # Telegram echoes back whatever secret set_webhook registered, so a fresh one per start works.
+        secret = secrets.token_urlsafe(32)
+        log.warning("WEBHOOK_SECRET is not set, generated a random one for this run")
+    executor = Executor(dispatcher, skip_updates=False)
+    app = web.Application()
+    configure_app(app, secret, concurrency)
+
+    async def set_webhook(dp: Dispatcher) -> None:
+        await dp.bot.set_webhook(url.rstrip("/") + path, secret_token=secret, max_connections=concurrency)
+
+    async def delete_webhook(dp: Dispatcher) -> None:
+        await dp.bot.delete_webhook()
+
+    executor.on_startup(set_webhook, polling=False)
+    if on_startup is not None:
+        executor.on_startup(on_startup, polling=False)
+    executor.on_shutdown(delete_webhook, polling=False)
+    if on_shutdown is not None:
+        executor.on_shutdown(on_shutdown, polling=False)
+    executor.set_webhook(path, request_handler=SecureWebhookRequestHandler, web_app=app)
+    executor.run_app(host=host, port=port)